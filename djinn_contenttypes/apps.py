@@ -13,3 +13,16 @@ class DjinnContenttypesAppConfig(AppConfig):
 
         from djinn_contenttypes.management import create_permissions
         signals.post_migrate.connect(create_permissions, sender=self)
+
+        # content types may have been (re)created
+        from djinn_contenttypes.models.contenttype import clear_ct_ids
+        signals.post_migrate.connect(clear_ct_ids)
+
+        from djinn_contenttypes.registry import CTRegistry
+        CTRegistry.freeze()
+
+        # content signal handlers are connected per content model, also
+        # for types registered from here on
+        from djinn_contenttypes.models import signal_processors
+        signal_processors.connect_all_content_signals()
+        CTRegistry.add_hook(signal_processors.registered)
@@ -0,0 +1,316 @@
+""" Unit of work for content signals. Within a transaction, the
+created, changed, publish and unpublish signals are not sent right away,
+but recorded per instance and sent once the transaction commits. If the
+transaction is rolled back, they are never sent at all.
+
+Intents for the same instance are coalesced: of created and changed only
+the strongest outcome is sent (created beats changed), and publish and
+unpublish cancel each other out. The arguments of a cancelled intent are
+not lost though: a later intent for the same signal gets them, so that
+publish, unpublish, publish still sends publish with first_edition.
+Outside of a transaction, signals are sent straight away.
+
+With ASYNC_CONTENT_SIGNALS set, signals declared queueable are not sent
+at all, but stored in the QueuedSignal table, to be sent by the
+process_signal_queue command. Within a transaction the row is written
+right away, and replaced or deleted as intents are coalesced, so it is
+committed or rolled back together with the change that caused it (the
+outbox pattern). Delivery is at least once: if any receiver fails, the
+signal is sent again later.
+
+Signals take part by declaring how they coalesce, e.g.:
+
+  coalesce(created, "content", 2)
+  coalesce(changed, "content", 1)
+  coalesce(publish, "publication", opposite=unpublish)
+  coalesce(unpublish, "publication", opposite=publish)
+
+"""
+
+from collections import OrderedDict
+from django.db import connections, router, transaction
+from djinn_contenttypes.settings import (
+    ASYNC_CONTENT_SIGNALS, PROFILE_SIGNALS)
+from djinn_contenttypes import profiling
+
+
+# signal -> (slot, strength)
+#
+_COALESCE = {}
+
+# signal -> signal it cancels out
+#
+_OPPOSITES = {}
+
+# name -> signal, for signals that may be sent by the queue worker
+#
+_QUEUEABLE = {}
+
+# Slots are sent in this order per instance
+#
+SLOTS = ["content", "publication"]
+
+
+def coalesce(signal, slot, strength=0, opposite=None):
+
+    """ Declare that intents for signal take up slot. A later intent in
+    the same slot replaces an earlier one, unless the earlier one is
+    stronger. An intent for the opposite signal removes both. """
+
+    _COALESCE[signal] = (slot, strength)
+
+    if opposite is not None:
+        _OPPOSITES[signal] = opposite
+        _OPPOSITES[opposite] = signal
+
+
+def queueable(signal, name):
+
+    """ Declare that signal may be sent asynchronously, under name """
+
+    _QUEUEABLE[name] = signal
+
+
+def queued_signal(name):
+
+    return _QUEUEABLE[name]
+
+
+def _queue(signal, instance, kwargs):
+
+    """ Store signal in the queue if it's queueable and the settings tell
+    us so. Return the queued row, or None if the signal is to be sent
+    now. """
+
+    if not ASYNC_CONTENT_SIGNALS:
+        return None
+
+    for name, _signal in _QUEUEABLE.items():
+        if _signal is signal:
+            # Import runtime: this module is imported by the models
+            from djinn_contenttypes.models.signalqueue import QueuedSignal
+            return QueuedSignal.objects.enqueue(name, instance, kwargs)
+
+    return None
+
+
+def _unqueue(row):
+
+    if row is not None:
+        row.delete()
+
+
+def _send(signal, sender, instance, kwargs):
+
+    """ Send signal now, or queue it if it's queueable and the settings
+    tell us so """
+
+    if _queue(signal, instance, kwargs) is not None:
+        return
+
+    if PROFILE_SIGNALS:
+        profiling.send(signal, sender, instance=instance, **kwargs)
+    else:
+        signal.send(sender, instance=instance, **kwargs)
+
+
+class _Marker(object):
+
+    """ Registered with transaction.on_commit for every savepoint that
+    intents are recorded in. Django drops it when the savepoint is rolled
+    back, and calls it on commit, so it tells whether the intents
+    recorded under it still count. """
+
+    def __init__(self):
+
+        self.called = False
+
+    def __call__(self):
+
+        self.called = True
+
+
+class SignalBuffer(object):
+
+    """ Signal intents recorded within a transaction, sent when the
+    transaction commits. There is one buffer per outermost transaction,
+    so an instance saved both in the transaction and in a nested atomic
+    block is signalled once. Intents are kept as a stack per instance and
+    slot, one level per savepoint they were recorded in, so the intents
+    of a savepoint that is rolled back are dropped, and what came before
+    them counts again.
+
+    The flush is registered with empty savepoint ids, and kept behind the
+    markers, so it runs after them on commit, and survives rollback of
+    any savepoint. Intents that are queued are written to the queue as
+    they come in, and kept in sync with the buffer, so flush leaves them
+    alone. """
+
+    def __init__(self, using):
+
+        self.using = using
+        self.intents = OrderedDict()
+        self.marker = None
+        self.marker_sids = None
+
+        self._flush_last()
+
+    def _callbacks(self):
+
+        return [callback[1] for callback in
+                connections[self.using].run_on_commit]
+
+    @property
+    def is_live(self):
+
+        return self.flush in self._callbacks()
+
+    def _flush_last(self):
+
+        """ Register flush, or move it behind the callbacks registered
+        since. This goes around transaction.on_commit, that would tie it
+        to the current savepoint. """
+
+        connection = connections[self.using]
+
+        connection.run_on_commit = [
+            callback for callback in connection.run_on_commit
+            if callback[1] != self.flush] + [(set(), self.flush)]
+
+    def _is_alive(self, marker):
+
+        return marker.called or marker in self._callbacks()
+
+    def _current_marker(self):
+
+        connection = connections[self.using]
+
+        if self.marker is None or \
+                self.marker_sids != connection.savepoint_ids or \
+                not self._is_alive(self.marker):
+
+            self.marker = _Marker()
+            self.marker_sids = list(connection.savepoint_ids)
+            transaction.on_commit(self.marker, using=self.using)
+            self._flush_last()
+
+        return self.marker
+
+    def _top(self, stack):
+
+        """ Drop the levels of rolled back savepoints, and return the
+        current (intent, carried) """
+
+        while stack and not self._is_alive(stack[-1][0]):
+            stack.pop()
+
+        return stack and stack[-1][1:] or (None, {})
+
+    def add(self, signal, sender, instance, kwargs):
+
+        slot, strength = _COALESCE.get(signal, (signal, 0))
+        key = (instance.__class__, instance.pk)
+        stack = self.intents.setdefault(key, {}).setdefault(slot, [])
+
+        pending, carried = self._top(stack)
+        carried = dict(carried)
+        marker = self._current_marker()
+
+        if pending is not None:
+
+            _signal, _sender, _instance, _kwargs, row = pending
+            _unqueue(row)
+
+            if _OPPOSITES.get(signal) is _signal:
+                # keep e.g. first_edition for the next publish
+                carried[_signal] = dict(carried.get(_signal, {}), **_kwargs)
+                self._push(stack, marker, None, carried)
+                return
+            elif _COALESCE.get(_signal, (slot, 0))[1] > strength:
+                signal, sender = _signal, _sender
+                kwargs = _kwargs
+            elif _signal is signal:
+                # keep e.g. first_edition of an earlier publish
+                kwargs = dict(_kwargs, **kwargs)
+
+        if signal in carried:
+            kwargs = dict(carried.pop(signal), **kwargs)
+
+        self._push(stack, marker,
+                   (signal, sender, instance, kwargs,
+                    _queue(signal, instance, kwargs)),
+                   carried)
+
+    def _push(self, stack, marker, intent, carried):
+
+        if stack and stack[-1][0] is marker:
+            stack[-1] = (marker, intent, carried)
+        else:
+            stack.append((marker, intent, carried))
+
+    def flush(self):
+
+        intents, self.intents = self.intents, OrderedDict()
+
+        for slots in intents.values():
+
+            ordered = [slot for slot in SLOTS if slot in slots] + \
+                [slot for slot in slots if slot not in SLOTS]
+
+            for slot in ordered:
+
+                intent = self._top(slots[slot])[0]
+
+                if intent is None:
+                    continue
+
+                signal, sender, instance, kwargs, row = intent
+
+                if row is None:
+                    _send(signal, sender, instance, kwargs)
+
+
+def _buffer(using):
+
+    """ The live buffer for the connection, if any. Connections are
+    thread local, so the buffers are too. """
+
+    buf = getattr(connections[using], "_signal_buffer", None)
+
+    if buf is not None and buf.is_live:
+        return buf
+
+    return None
+
+
+def send(signal, sender, instance, **kwargs):
+
+    """ Send signal for instance when the current transaction commits, or
+    right away if there is no transaction. """
+
+    using = router.db_for_write(instance.__class__, instance=instance)
+    connection = connections[using]
+
+    if not connection.in_atomic_block:
+        _send(signal, sender, instance, kwargs)
+        return
+
+    buf = _buffer(using)
+
+    if buf is None:
+        buf = connection._signal_buffer = SignalBuffer(using)
+
+    buf.add(signal, sender, instance, kwargs)
+
+
+def flush():
+
+    """ Send all pending signals now. Tests run within a transaction that
+    is never committed, so they need this to see the signals. """
+
+    for using in connections:
+
+        buf = _buffer(using)
+
+        if buf is not None:
+            buf.flush()
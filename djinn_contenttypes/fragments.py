@@ -0,0 +1,111 @@
+""" Cache for rendered content snippets. A fragment is keyed by the
+object's cache key, its changed date, the language, the fragment name and
+whatever else the rendering depends on, like the permissions of the user.
+
+On top of that every object has a version token in the cache that is part
+of the key. Invalidating an object's fragments drops the token, so that
+all fragments rendered before are never read again, without having to
+know their keys. """
+
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from djinn_contenttypes.settings import FRAGMENT_CACHE_TIMEOUT
+
+
+def _version_key(obj):
+
+    return "djinn_fragment_version_%s" % obj.get_cache_key()
+
+
+def _version(obj):
+
+    """ Get the fragment version of obj. The version is kept on the
+    instance as well, since the same object is usually rendered a number
+    of times in one request. """
+
+    version = obj.__dict__.get("_fragment_version")
+
+    if version is None:
+
+        key = _version_key(obj)
+        version = cache.get(key)
+
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key) or ""
+
+        obj.__dict__["_fragment_version"] = version
+
+    return version
+
+
+def fragment_key(obj, name, *parts):
+
+    """ Return the cache key for fragment name of obj, or None if obj or
+    the settings do not allow for caching """
+
+    if not FRAGMENT_CACHE_TIMEOUT or not hasattr(obj, "get_cache_key"):
+        return None
+
+    changed = getattr(obj, "changed", None)
+
+    raw = ":".join(
+        [obj.get_cache_key(), _version(obj),
+         changed and changed.isoformat() or "", get_language() or "", name] +
+        [str(part) for part in parts])
+
+    return "djinn_fragment_%s" % hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def get_fragment(key):
+
+    return cache.get(key)
+
+
+def set_fragment(key, content):
+
+    cache.set(key, content, FRAGMENT_CACHE_TIMEOUT)
+
+
+def _render(context, template_name, values):
+
+    """ Render the template the way an inclusion tag does: with values
+    only, but within the caller's context, so the request, autoescaping
+    and localization settings are kept """
+
+    template = context.template.engine.get_template(template_name)
+
+    return template.render(context.new(values))
+
+
+def render_fragment(context, template_name, values, obj, *parts):
+
+    """ Render the template for obj from within a template tag, or return
+    the cached result. Context is the caller's template context, values
+    the variables for the template. Parts are all values, next to obj,
+    that the rendering depends on. """
+
+    key = fragment_key(obj, template_name, *parts)
+
+    if key is None:
+        return _render(context, template_name, values)
+
+    html = get_fragment(key)
+
+    if html is None:
+        html = _render(context, template_name, values)
+        set_fragment(key, html)
+
+    return mark_safe(html)
+
+
+def invalidate_fragments(obj):
+
+    """ Drop all cached fragments of obj """
+
+    if hasattr(obj, "get_cache_key"):
+        obj.__dict__.pop("_fragment_version", None)
+        cache.delete(_version_key(obj))
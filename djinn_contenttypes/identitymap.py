@@ -0,0 +1,71 @@
+""" Request scoped identity map for content objects, so that the same
+object is loaded only once per request. The map is only active within
+a request handled by IdentityMapMiddleware; elsewhere (management
+commands, long running workers) every lookup simply misses. """
+
+import threading
+from djinn_contenttypes.models.contenttype import get_ct_id
+
+
+_local = threading.local()
+
+
+def activate():
+
+    _local.objects = {}
+
+
+def deactivate():
+
+    _local.__dict__.pop("objects", None)
+
+
+def get(model, pk):
+
+    """ Return the object of the given model with pk, if loaded before
+    within this request. Otherwise return None """
+
+    objects = getattr(_local, "objects", None)
+
+    if objects is None:
+        return None
+
+    return objects.get((get_ct_id(model), model._meta.pk.to_python(pk)))
+
+
+def add(obj):
+
+    """ Remember obj for the rest of the request """
+
+    objects = getattr(_local, "objects", None)
+
+    if objects is not None and obj is not None:
+        objects[(get_ct_id(obj), obj.pk)] = obj
+
+    return obj
+
+
+def forget(obj):
+
+    objects = getattr(_local, "objects", None)
+
+    if objects is not None:
+        objects.pop((get_ct_id(obj), obj.pk), None)
+
+
+class IdentityMapMiddleware(object):
+
+    """ Activate the identity map for the duration of the request """
+
+    def __init__(self, get_response):
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+
+        activate()
+
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate()
@@ -0,0 +1,160 @@
+""" Deferred search indexing. The CRUD views call schedule_index instead
+of updating the search index within the request. With
+DEFERRED_SEARCH_INDEXING set, the object is put in the IndexQueue table
+once the transaction commits, and the process_index_queue command indexes
+the queued objects in batches: the viewers of a batch are computed in one
+go, and the backend gets a single update call per content type. Objects
+that fail to index are tried again later, like queued signals. Without
+the setting, the index is updated right away, as it always was, which is
+also what tests want. """
+
+import logging
+from functools import partial
+from django.core.cache import cache
+from django.db import transaction
+from haystack import connections as haystack_connections
+from haystack.exceptions import NotHandled
+from djinn_search.utils import update_index_for_instance
+from djinn_contenttypes.models.contenttype import get_ct_id
+from djinn_contenttypes.settings import (
+    DEFERRED_SEARCH_INDEXING, SEARCH_INDEX_QUEUE_WINDOW_SECS,
+    SEARCH_INDEX_QUEUE_MAX_ATTEMPTS)
+
+
+LOG = logging.getLogger("djinn_contenttypes")
+
+
+def _window_key(ct_id, object_id):
+
+    return "djinn_index_queued_%s_%s" % (ct_id, object_id)
+
+
+def enqueue(ct_id, object_id):
+
+    """ Queue the object for indexing. Within the window, repeated calls
+    for the same object cost a cache lookup only. """
+
+    # Import runtime: this module is imported by the views
+    from djinn_contenttypes.models.indexqueue import IndexQueue
+
+    if cache.add(_window_key(ct_id, object_id), 1,
+                 SEARCH_INDEX_QUEUE_WINDOW_SECS):
+        IndexQueue.objects.enqueue(ct_id, object_id)
+
+
+def schedule_index(instance):
+
+    """ Have the search index updated for instance: queued once the
+    current transaction commits, or right away if indexing is not
+    deferred """
+
+    if DEFERRED_SEARCH_INDEXING:
+        transaction.on_commit(
+            partial(enqueue, get_ct_id(instance), instance.pk))
+    else:
+        update_index_for_instance(instance)
+
+
+def index_objects(model, pks, using="default"):
+
+    """ Update the index for the objects of model with the given primary
+    keys, with one backend call. Objects that are gone are removed from
+    the index. Returns the number of objects updated. """
+
+    # Import runtime: the models depend on this package
+    from djinn_contenttypes.models.base import BaseContent
+
+    connection = haystack_connections[using]
+
+    try:
+        index = connection.get_unified_index().get_index(model)
+    except NotHandled:
+        return 0
+
+    backend = connection.get_backend()
+    objects = model.objects.in_bulk(pks)
+
+    for pk in set(pks) - set(objects):
+        backend.remove("%s.%s.%s" % (model._meta.app_label,
+                                     model._meta.model_name, pk))
+
+    objects = [obj for obj in objects.values() if index.should_update(obj)]
+
+    if issubclass(model, BaseContent):
+        BaseContent.prime_viewers(objects)
+
+    if objects:
+        backend.update(index, objects)
+
+    return len(objects)
+
+
+def _index_entries(model, entries):
+
+    """ Index the entries of model in one go. If that fails, index them
+    one by one, so that one bad object doesn't hold up the rest. Failed
+    entries are tried again later. """
+
+    # Import runtime: this module is imported by the views
+    from djinn_contenttypes.models.indexqueue import IndexQueue
+
+    if len(entries) > 1:
+        try:
+            with transaction.atomic():
+                index_objects(model, [entry.object_id for entry in entries])
+        except Exception:
+            LOG.warning("Indexing %d objects of type %s failed, trying "
+                        "one by one", len(entries), model.__name__)
+        else:
+            IndexQueue.objects.done(entries)
+            return
+
+    for entry in entries:
+        try:
+            with transaction.atomic():
+                index_objects(model, [entry.object_id])
+        except Exception as exc:
+            LOG.exception("Indexing %s:%s failed", entry.object_ct_id,
+                          entry.object_id)
+            IndexQueue.objects.failed(entry, exc)
+        else:
+            IndexQueue.objects.done([entry])
+
+
+def process(batch_size=100, max_attempts=SEARCH_INDEX_QUEUE_MAX_ATTEMPTS):
+
+    """ Index a batch of due objects from the queue. Objects that fail to
+    index are tried again later, with exponential backoff, until
+    max_attempts is reached. Returns the number of objects taken from the
+    queue. """
+
+    # Import runtime: this module is imported by the views
+    from django.contrib.contenttypes.models import ContentType
+    from djinn_contenttypes.models.indexqueue import IndexQueue
+
+    with transaction.atomic():
+
+        entries = IndexQueue.objects.claim(batch_size, max_attempts)
+
+        # Saves from here on need to be queued again
+        cache.delete_many([_window_key(entry.object_ct_id, entry.object_id)
+                           for entry in entries])
+
+        by_ct = {}
+
+        for entry in entries:
+            by_ct.setdefault(entry.object_ct_id, []).append(entry)
+
+        for ct_id, ct_entries in by_ct.items():
+
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+
+            if model is None:
+                LOG.warning("Dropping index entries for unknown type %s",
+                            ct_id)
+                IndexQueue.objects.done(ct_entries)
+                continue
+
+            _index_entries(model, ct_entries)
+
+    return len(entries)
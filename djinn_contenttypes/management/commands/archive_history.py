@@ -0,0 +1,84 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from djinn_contenttypes.models.history import (
+    History, PUBLISHED, UNPUBLISHED)
+from djinn_contenttypes.settings import HISTORY_RETENTION_DAYS
+
+
+MARKERS = [PUBLISHED, UNPUBLISHED]
+
+
+def archivable(cutoff):
+
+    """ History older than cutoff, except for the last PUBLISHED or
+    UNPUBLISHED entry per object: the publishing logic depends on
+    that. """
+
+    newer_marker = History.objects.filter(
+        object_ct=OuterRef("object_ct"),
+        object_id=OuterRef("object_id"),
+        status_flag__in=MARKERS).filter(
+            Q(date__gt=OuterRef("date")) |
+            Q(date=OuterRef("date"), id__gt=OuterRef("id")))
+
+    return History.objects.filter(date__lt=cutoff).annotate(
+        superseded=Exists(newer_marker)).filter(
+            ~Q(status_flag__in=MARKERS) | Q(superseded=True))
+
+
+class Command(BaseCommand):
+
+    help = """Move old history to a gzipped JSON lines file"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "archive", help="File to append the archived history to, "
+            "e.g. history.jsonl.gz")
+        parser.add_argument(
+            "--days", type=int, default=HISTORY_RETENTION_DAYS,
+            help="Archive history older than this many days")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of entries to archive at once")
+
+    def handle(self, *args, **options):
+
+        cutoff = datetime.now() - timedelta(days=options['days'])
+        last_id = 0
+        total = 0
+
+        with gzip.open(options['archive'], "at") as archive:
+
+            while True:
+
+                batch = list(archivable(cutoff).filter(
+                    id__gt=last_id).order_by("id").values(
+                        "id", "date", "user", "object_ct__app_label",
+                        "object_ct__model", "object_id", "status_flag",
+                        "change_message")[:options['batch_size']])
+
+                if not batch:
+                    break
+
+                for entry in batch:
+                    entry['date'] = entry['date'].isoformat()
+                    archive.write(json.dumps(entry) + "\n")
+
+                # Make sure the entries are safe before removing them
+                archive.flush()
+
+                ids = [entry['id'] for entry in batch]
+
+                with transaction.atomic():
+                    History.objects.filter(id__in=ids).delete()
+
+                last_id = ids[-1]
+                total += len(ids)
+
+        self.stdout.write("Archived %d history entries older than %s" % (
+            total, cutoff))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from djinn_contenttypes.models.history import (
+    History, PublicationState, backfill_publication_state)
+
+
+class Command(BaseCommand):
+
+    help = """Rebuild the last publication state of all content from the
+    history"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of states to insert at once")
+
+    def handle(self, *args, **options):
+
+        count = backfill_publication_state(
+            History, PublicationState, batch_size=options['batch_size'])
+
+        self.stdout.write("Publication state set for %d objects" % count)
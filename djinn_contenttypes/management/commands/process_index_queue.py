@@ -0,0 +1,56 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.utils import translation
+from djinn_contenttypes.indexing import process
+from djinn_contenttypes.settings import SEARCH_INDEX_QUEUE_MAX_ATTEMPTS
+
+
+LOG = logging.getLogger("djinn_contenttypes")
+
+
+class Command(BaseCommand):
+
+    help = """Update the search index for content queued because of
+    DEFERRED_SEARCH_INDEXING"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Number of objects to index per backend call")
+        parser.add_argument(
+            "--max-attempts", type=int,
+            default=SEARCH_INDEX_QUEUE_MAX_ATTEMPTS,
+            help="Give up on an object after this many failures")
+        parser.add_argument(
+            "--poll", type=int, default=0,
+            help="Keep running, checking the queue every so many seconds")
+
+    def handle(self, *args, **options):
+
+        translation.activate("nl_NL")
+
+        while True:
+
+            try:
+                count = process(batch_size=options['batch_size'],
+                                max_attempts=options['max_attempts'])
+            except Exception:
+                # Keep polling, e.g. when the search backend is down
+                if not options['poll']:
+                    raise
+                LOG.exception("Processing the index queue failed")
+                count = 0
+
+            if count:
+                self.stdout.write("Indexed %d objects" % count)
+
+            # A full batch means there is probably more to do
+            if count == options['batch_size']:
+                continue
+
+            if not options['poll']:
+                break
+
+            time.sleep(options['poll'])
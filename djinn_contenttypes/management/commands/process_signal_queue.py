@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import translation
+from djinn_contenttypes.models.signalqueue import QueuedSignal
+from djinn_contenttypes.settings import SIGNAL_QUEUE_MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+
+    help = """Send the publish and unpublish signals that were queued
+    because of ASYNC_CONTENT_SIGNALS"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Number of signals to send per transaction")
+        parser.add_argument(
+            "--max-attempts", type=int, default=SIGNAL_QUEUE_MAX_ATTEMPTS,
+            help="Give up on a signal after this many failures")
+        parser.add_argument(
+            "--poll", type=int, default=0,
+            help="Keep running, checking the queue every so many seconds")
+
+    def handle(self, *args, **options):
+
+        translation.activate("nl_NL")
+
+        while True:
+
+            sent, failed = QueuedSignal.objects.process(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'])
+
+            if sent or failed:
+                self.stdout.write("Sent %d signals, %d failed" % (
+                    sent, failed))
+
+            # A full batch means there is probably more to do
+            if sent + failed == options['batch_size']:
+                continue
+
+            if not options['poll']:
+                break
+
+            time.sleep(options['poll'])
@@ -1,34 +1,57 @@
+import time
 from datetime import datetime
 from django.core.management.base import BaseCommand
-from django.db.models import Q
-from djinn_contenttypes.models.publishable import PublishableContent
-from djinn_contenttypes.registry import CTRegistry
 from django.utils import translation
+from djinn_contenttypes.publishing import (
+    publishable_models, due_for_publish, publish_instance, publish_chunk,
+    process_batched)
 
 
 class Command(BaseCommand):
 
     help = """Publish contenttypes if need be"""
 
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Process due content in batches of this size, instead of "
+            "saving each instance")
+        parser.add_argument(
+            "--dry-run", action="store_true", default=False,
+            help="Only report how much content is due")
+
     def handle(self, *args, **options):
 
         """Check contentitems that just have reached published state
         due to publish timestamp. We just call 'save' on the instance,
-        and let the signal handlers take care of the rest. """
+        and let the signal handlers take care of the rest. Unless a batch
+        size is given: then use the batched engine."""
 
         now = datetime.now()
         translation.activate("nl_NL")
 
-        for ctype in CTRegistry.list_types():
+        for model in publishable_models():
+
+            start = time.time()
+            qs = due_for_publish(model, now)
+
+            if options['dry_run']:
+                due, published = qs.count(), 0
+            elif options['batch_size']:
+                due, published = process_batched(
+                    qs, publish_chunk, options['batch_size'])
+            else:
+                due = published = 0
 
-            model = CTRegistry.get_attr(ctype, "class")
+                for instance in qs:
 
-            if issubclass(model, PublishableContent):
+                    publish_instance(instance)
+                    due += 1
 
-                for instance in model.objects.filter(publish_notified=False,
-                                                     publish_from__lt=now).\
-                        filter(Q(publish_to__isnull=True) |
-                        Q(publish_to__gt=now)):
+                published = due
 
-                    # print "publishing %s-%d" % (instance.ct_name, instance.id)
-                    instance.save()
+            if due:
+                self.stdout.write(
+                    "%s: %d due, %d published in %.2fs" % (
+                        model.__name__, due, published, time.time() - start))
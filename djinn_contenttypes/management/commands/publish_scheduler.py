@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import translation
+from djinn_contenttypes.scheduler import PublishScheduler
+from djinn_contenttypes.settings import (
+    PUBLISH_SCHEDULER_POLL_SECS, PUBLISH_SCHEDULER_RELOAD_SECS)
+
+
+class Command(BaseCommand):
+
+    help = """Long running replacement for the publish and unpublish
+    commands: (un)publish content as soon as it is due"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--poll", type=int, default=PUBLISH_SCHEDULER_POLL_SECS,
+            help="Max seconds to sleep before checking for changes")
+        parser.add_argument(
+            "--reload", type=int, default=PUBLISH_SCHEDULER_RELOAD_SECS,
+            help="Seconds between full reloads of the schedule")
+
+    def handle(self, *args, **options):
+
+        translation.activate("nl_NL")
+
+        PublishScheduler(poll=options['poll'],
+                         reload=options['reload']).run()
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from djinn_contenttypes import profiling
+
+
+class Command(BaseCommand):
+
+    help = """Show timings of the content signal handling, as collected
+    with PROFILE_SIGNALS set"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--reset", action="store_true", default=False,
+            help="Throw away all samples collected so far")
+
+    def handle(self, *args, **options):
+
+        if options['reset']:
+            profiling.reset()
+            return
+
+        rows = profiling.stats()
+
+        if not rows:
+            self.stdout.write("No samples. Is PROFILE_SIGNALS set?")
+            return
+
+        self.stdout.write("%-60s %7s %8s %8s %8s %8s %7s" % (
+            "name", "count", "p50 ms", "p90 ms", "p99 ms", "max ms",
+            "queries"))
+
+        for row in rows:
+            self.stdout.write(
+                "%(name)-60s %(count)7d %(p50)8.2f %(p90)8.2f %(p99)8.2f "
+                "%(max)8.2f %(queries)7.1f" % row)
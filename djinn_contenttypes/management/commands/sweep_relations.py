@@ -0,0 +1,82 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+
+def dangling_relations(relation_model, ct_id, side):
+
+    """ Relations that have content of the given content type on the
+    given side ('src' or 'tgt'), where that content no longer exists """
+
+    relations = relation_model.objects.filter(
+        **{"%s_content_type_id" % side: ct_id})
+
+    model = ContentType.objects.get_for_id(ct_id).model_class()
+
+    # Model is gone altogether...
+    #
+    if model is None:
+        return relations
+
+    return relations.annotate(present=Exists(model._default_manager.filter(
+        pk=OuterRef("%s_object_id" % side)))).filter(present=False)
+
+
+class Command(BaseCommand):
+
+    help = """Remove relations to or from content that no longer exists"""
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of relations to delete at once")
+        parser.add_argument(
+            "--dry-run", action="store_true", default=False,
+            help="Only report the number of broken relations")
+
+    def handle(self, *args, **options):
+
+        relation_model = apps.get_model("pgcontent", "SimpleRelation")
+        total = 0
+
+        # A relation may be broken on both sides, but is counted once, like
+        # it is removed once
+        #
+        found = set()
+
+        for side in ["src", "tgt"]:
+
+            ct_ids = relation_model.objects.order_by().values_list(
+                "%s_content_type" % side, flat=True).distinct()
+
+            for ct_id in list(ct_ids):
+
+                dangling = dangling_relations(relation_model, ct_id, side)
+                count = 0
+
+                if options['dry_run']:
+                    ids = set(dangling.values_list("pk", flat=True)) - found
+                    found.update(ids)
+                    count = len(ids)
+                else:
+                    while True:
+
+                        ids = list(dangling.values_list(
+                            "pk", flat=True)[:options['batch_size']])
+
+                        if not ids:
+                            break
+
+                        relation_model.objects.filter(pk__in=ids).delete()
+                        count += len(ids)
+
+                if count:
+                    self.stdout.write("%s %s: %d broken relations" % (
+                        ContentType.objects.get_for_id(ct_id), side, count))
+
+                total += count
+
+        self.stdout.write("%d broken relations %s" % (
+            total, options['dry_run'] and "found" or "removed"))
@@ -1,53 +1,71 @@
+import time
 from datetime import datetime
 from django.core.management.base import BaseCommand
-from django.db.models import Q
-from djinn_contenttypes.models.publishable import PublishableContent
-from djinn_contenttypes.registry import CTRegistry
 from django.utils import translation
+from djinn_contenttypes.publishing import (
+    publishable_models, due_for_unpublish, due_for_removal,
+    unpublish_instance, unpublish_chunk, remove_chunk, process_batched)
 
 
 class Command(BaseCommand):
 
     help = """Publish contenttypes if need be"""
 
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Process due content in batches of this size, instead of "
+            "saving each instance")
+        parser.add_argument(
+            "--dry-run", action="store_true", default=False,
+            help="Only report how much content is due")
+
     def handle(self, *args, **options):
 
         """Check contentitems that are beyond the publish_to date.  We just
         call 'save' on the instance, and let the signal handlers take
-        care of the rest.
+        care of the rest. Unless a batch size is given: then use the
+        batched engine.
 
         """
 
         now = datetime.now()
         translation.activate("nl_NL")
 
-        for ctype in CTRegistry.list_types():
+        for model in publishable_models():
 
-            model = CTRegistry.get_attr(ctype, "class")
+            start = time.time()
+            qs = due_for_unpublish(model, now)
+            removable = due_for_removal(model, now)
 
-            if issubclass(model, PublishableContent):
+            if options['dry_run']:
+                due, unpublished = qs.count(), 0
+                removed = removable.count()
+            elif options['batch_size']:
+                due, unpublished = process_batched(
+                    qs, unpublish_chunk, options['batch_size'])
+                removed = process_batched(
+                    removable, remove_chunk, options['batch_size'])[1]
+            else:
+                due = unpublished = removed = 0
 
-                for instance in model.objects.filter(
-                        unpublish_notified=False,
-                        publish_to__isnull=False).filter(
-                            Q(publish_to__lt=now) | Q(publish_from__gt=now)):
+                for instance in qs:
 
-                        # model.objects.filter(
-                        # unpublish_notified=False,
-                        # publish_to__isnull=False, publish_to__lt=now):
+                    unpublish_instance(instance)
+                    due += 1
 
-                    # be sure this unpublish is not handled again
-                    instance.unpublish_notified = True
-
-                    # prepare for a following publication of this instance
-                    # print "un-publishing %s-%d" % (instance.ct_name, instance.id)
-                    instance.publish_notified = False
-                    instance.save()
+                unpublished = due
 
                 # clean up tenacious content...
                 #
-                for instance in model.objects.filter(
-                        remove_after_publish_to=True,
-                        publish_to__isnull=False, publish_to__lt=now):
+                for instance in removable:
 
                     instance.delete()
+                    removed += 1
+
+            if due or removed:
+                self.stdout.write(
+                    "%s: %d due, %d unpublished, %d removed in %.2fs" % (
+                        model.__name__, due, unpublished, removed,
+                        time.time() - start))
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+
+    from djinn_contenttypes.models.history import backfill_publication_state
+
+    backfill_publication_state(
+        apps.get_model("djinn_contenttypes", "History"),
+        apps.get_model("djinn_contenttypes", "PublicationState"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('djinn_contenttypes', '0002_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicationState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('status_flag', models.PositiveSmallIntegerField()),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('object_ct', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='publicationstate',
+            unique_together={('object_ct', 'object_id')},
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
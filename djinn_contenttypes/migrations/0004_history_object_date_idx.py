@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djinn_contenttypes', '0003_publicationstate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['object_ct', 'object_id', '-date'], name='history_object_date_idx'),
+        ),
+    ]
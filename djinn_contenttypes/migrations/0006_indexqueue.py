@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('djinn_contenttypes', '0005_queuedsignal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexQueue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('queued', models.DateTimeField(auto_now_add=True)),
+                ('object_ct', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexqueue',
+            unique_together={('object_ct', 'object_id')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djinn_contenttypes', '0006_indexqueue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexqueue',
+            name='next_attempt',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.now),
+        ),
+        migrations.AddField(
+            model_name='indexqueue',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='indexqueue',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djinn_contenttypes', '0007_indexqueue_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='history',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
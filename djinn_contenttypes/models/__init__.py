@@ -1,4 +1,6 @@
 from .attachment import ImgAttachment, FileAttachment
 from .highlight import Highlight
-from .history import History
+from .history import History, PublicationState
+from .signalqueue import QueuedSignal
+from .indexqueue import IndexQueue
 from .category import Category
@@ -1,10 +1,15 @@
+from collections import namedtuple
 from django.db import models
+from django.db.models import prefetch_related_objects
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.auth.models import User, Permission
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.auth.models import User
 from django.template.defaultfilters import slugify
 import django
 from djinn_contenttypes.models.swappablemodel_mixin import SwappableModelMixin
+from djinn_contenttypes.models.contenttype import ContentTypeId, get_ct_id
+from djinn_contenttypes import identitymap
 
 if django.VERSION < (1, 10):
     from django.core.urlresolvers import reverse
@@ -15,9 +20,38 @@ from pgauth.models import UserGroup
 from pgauth.settings import VIEWER_ROLE_ID
 from djinn_contenttypes.models.sharing import SharingMixin
 from djinn_contenttypes.models.relatable import RelatableMixin
+from djinn_workflow.models import ObjectState
 from djinn_workflow.utils import get_state
 
 
+# Everything that determines whether content is visible, in one go. See
+# BaseContent.visibility. Published depends on the time, so it is not part
+# of the snapshot, but filled in on every access.
+#
+Visibility = namedtuple("Visibility",
+                        ["state", "closed_group", "deleted", "published"])
+
+
+def bulk_local_roles(objects):
+
+    """ Return the local roles of all given content objects as one
+    queryset, together with the generic foreign key that points the
+    local roles to their content. Note that for mixed content types the
+    queryset may contain more roles than asked for, so check the content
+    type and object id of the roles where it matters. """
+
+    lrole_model = objects[0].get_local_roles().model
+    instance_fk = [fld for fld in lrole_model._meta.private_fields
+                   if isinstance(fld, GenericForeignKey)][0]
+
+    local_roles = lrole_model.objects.filter(**{
+        "%s_id__in" % instance_fk.ct_field: set(
+            get_ct_id(obj) for obj in objects),
+        "%s__in" % instance_fk.fk_field: set(obj.pk for obj in objects)})
+
+    return local_roles, instance_fk
+
+
 class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
                   SwappableModelMixin):
 
@@ -42,6 +76,10 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
     #
     create_tmp_object = False
 
+    # Id of the content type of the class, without lookup
+    #
+    ct_id = ContentTypeId()
+
     def get_cache_key(self):
 
         return "%s_%s_%s" % (self.app_label, self.ct_name, self.id)
@@ -63,6 +101,9 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
             if owner:
                 self.creator = owner
 
+        # post_save handlers should see the state as it is after the save
+        self.invalidate_visibility()
+
         response = super(BaseContent, self).save(*args, **kwargs)
 
         if not self.get_owner():
@@ -94,9 +135,10 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
     @property
     def ct_class(self):
 
-        """ Use this method at your own peril... it's expensive"""
+        """ Content type of the class. If you only need the id, use
+        ct_id """
 
-        return ContentType.objects.get_for_model(self.__class__)
+        return ContentType.objects.get_for_id(self.ct_id)
 
     @property
     def ct_name(self):
@@ -122,7 +164,110 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
 
         # Checks for membership_type in UserGroup this content_item possibly is
         # placed in
-        return self.parentusergroup and self.parentusergroup.is_closed
+        return self.visibility.closed_group
+
+    def _visibility_key(self):
+
+        """ The in-memory values the visibility snapshot was derived
+        from. If any of these change, the snapshot is recomputed. """
+
+        return (self.pk, self.parentusergroup_id,
+                getattr(self, "publish_from", None),
+                getattr(self, "publish_to", None))
+
+    @property
+    def visibility(self):
+
+        """ Snapshot of workflow state name, closed group and deleted
+        flags, plus the published flag. The flags take a couple of queries
+        to determine, and are needed over and over again (is_public,
+        get_local_roles, viewers), so compute them once per instance. The
+        snapshot is dropped on save, delete and workflow state change.
+        Published is computed on every access, since publish_from and
+        publish_to may pass while the instance lives on. """
+
+        cached = self.__dict__.get("_visibility")
+
+        if cached is not None and cached[0] == self._visibility_key():
+            return cached[1]._replace(
+                published=getattr(self, "is_published", True))
+
+        if self.pk:
+            deleted = not self.__class__.objects.filter(pk=self.pk).exists()
+        else:
+            deleted = True
+
+        return self._set_visibility(getattr(get_state(self), "name", None),
+                                    deleted)
+
+    def _set_visibility(self, state, deleted):
+
+        snapshot = Visibility(
+            state=state,
+            closed_group=bool(self.parentusergroup and
+                              self.parentusergroup.is_closed),
+            deleted=bool(self.created and deleted),
+            published=None)
+
+        self.__dict__["_visibility"] = (self._visibility_key(), snapshot)
+
+        return snapshot._replace(published=getattr(self, "is_published", True))
+
+    @staticmethod
+    def prime_visibility(objects):
+
+        """ Compute the visibility snapshot for a list of content objects
+        in one go: one query for the workflow states, and per content
+        type one for the parent groups and one existence check. Objects
+        that already have a valid snapshot are left alone. """
+
+        todo = [obj for obj in objects if obj.pk and (
+            obj.__dict__.get("_visibility") is None or
+            obj.__dict__["_visibility"][0] != obj._visibility_key())]
+
+        if not todo:
+            return
+
+        by_class = {}
+
+        for obj in todo:
+            by_class.setdefault(obj.__class__, []).append(obj)
+
+        existing = set()
+
+        for clazz, instances in by_class.items():
+            prefetch_related_objects(instances, "parentusergroup")
+            existing.update(
+                (clazz, pk) for pk in clazz.objects.filter(
+                    pk__in=[obj.pk for obj in instances]).values_list(
+                        "pk", flat=True))
+
+        states = {}
+
+        for objstate in ObjectState.objects.filter(
+                object_ct_id__in=set(clazz.ct_id for clazz in by_class),
+                object_id__in=set(obj.pk for obj in todo)).select_related(
+                    "state"):
+            states[(objstate.object_ct_id, objstate.object_id)] = \
+                objstate.state.name
+
+        for obj in todo:
+            key = (obj.ct_id, obj.pk)
+
+            if key in states:
+                state = states[key]
+            else:
+                # No state yet, let the workflow assign the initial one
+                state = getattr(get_state(obj), "name", None)
+
+            obj._set_visibility(state, (obj.__class__, obj.pk) not in existing)
+
+    def invalidate_visibility(self):
+
+        """ Drop the visibility snapshot, and primed viewers, if any """
+
+        self.__dict__.pop("_visibility", None)
+        self.__dict__.pop("_viewers", None)
 
     @property
     def is_public(self):
@@ -139,11 +284,14 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
             return False
         elif self.is_tmp:
             return False
-        elif self.in_closed_group:
+
+        visibility = self.visibility
+
+        if visibility.closed_group:
             return False
-        elif get_state(self).name == "private":
+        elif visibility.state == "private":
             return False
-        elif self.is_deleted:
+        elif visibility.deleted:
             return False
         else:
             return True
@@ -151,12 +299,7 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
     @property
     def is_deleted(self):
 
-        try:
-            self.__class__.objects.get(pk=self.id)
-            _deleted = False
-        except self.__class__.DoesNotExist:
-            _deleted = True
-        return self.created and _deleted
+        return self.visibility.deleted
 
     @property
     def permission_authority(self):
@@ -187,7 +330,15 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
 
         self.pre_delete()
 
-        return super(BaseContent, self).delete()
+        self.rm_all_relations()
+
+        identitymap.forget(self)
+
+        response = super(BaseContent, self).delete()
+
+        self.invalidate_visibility()
+
+        return response
 
     def get_absolute_url(self):
 
@@ -213,8 +364,8 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
                     name=VIEWER_ROLE_ID).select_related()
                 roles = roles | viewer
 
-            elif get_state(self).name == "private" or (
-                    hasattr(self, 'is_published') and not self.is_published):
+            elif self.visibility.state == "private" or \
+                    not self.visibility.published:
 
                 pass
 
@@ -233,39 +384,90 @@ class BaseContent(models.Model, LocalRoleMixin, SharingMixin, RelatableMixin,
     def viewers(self):
 
         """ Return a list of all unique users and groups that can
-        'view' this content."""
+        'view' this content. Uses the viewers set by prime_viewers, if
+        any. """
 
-        _viewers = set()
+        viewers = self.__dict__.get("_viewers")
 
-        view = Permission.objects.get(codename="view")
+        if viewers is not None:
+            return viewers
 
-        if self.is_public:
-            _viewers.add("group_users")
-        elif self.parentusergroup and self.is_published and get_state(
-                self).name != "private":
+        return self.bulk_viewers([self])[0]
 
-            _viewers.add("group_%d" % self.parentusergroup.id)
+    @staticmethod
+    def prime_viewers(objects):
 
-        for lrole in self.get_local_roles():
-            if view in lrole.role.permissions.all():
+        """ Compute the viewers of all objects with bulk_viewers, and keep
+        them on the objects, so that the viewers property doesn't query
+        again, e.g. when the search index asks for them. """
+
+        objects = list(objects)
+
+        for obj, viewers in zip(objects, BaseContent.bulk_viewers(objects)):
+            obj.__dict__["_viewers"] = viewers
+
+        return objects
+
+    @staticmethod
+    def bulk_viewers(objects):
+
+        """ Return the viewers for a list or queryset of content objects,
+        in the same order. This uses a fixed number of queries, no
+        matter how many objects are passed: one for the local roles of
+        all objects, one for the roles that hold the view permission and
+        one for the workflow states (see prime_visibility). Use this
+        when indexing lots of content. """
+
+        if isinstance(objects, models.QuerySet):
+            objects = objects.select_related("parentusergroup")
+
+        objects = list(objects)
+
+        if not objects:
+            return []
+
+        BaseContent.prime_visibility(objects)
+
+        lroles = {}
+        local_roles, instance_fk = bulk_local_roles(objects)
+
+        for lrole in local_roles.select_related("user", "usergroup"):
+
+            key = (getattr(lrole, "%s_id" % instance_fk.ct_field),
+                   int(getattr(lrole, instance_fk.fk_field)))
+            lroles.setdefault(key, []).append(lrole)
+
+        view_roles = set(Role.objects.filter(
+            pk__in=set(lrole.role_id for _lroles in lroles.values()
+                       for lrole in _lroles),
+            permissions__codename="view").values_list("pk", flat=True))
+
+        result = []
+
+        for obj in objects:
+
+            _viewers = set()
+
+            if obj.is_public:
+                _viewers.add("group_users")
+            elif obj.parentusergroup and obj.visibility.published and \
+                    obj.visibility.state != "private":
+
+                _viewers.add("group_%d" % obj.parentusergroup.id)
+
+            for lrole in lroles.get((obj.ct_id, obj.pk), []):
 
-                try:
-                    viewuser = lrole.user
-                except User.DoesNotExist:
-                    viewuser = None
+                if lrole.role_id not in view_roles:
+                    continue
 
-                if viewuser:
-                    _viewers.add("user_%s" % viewuser.username)
-                else:
-                    try:
-                        viewusergroup = lrole.usergroup
-                    except UserGroup.DoesNotExist:
-                        viewusergroup = None
+                if lrole.user:
+                    _viewers.add("user_%s" % lrole.user.username)
+                elif lrole.usergroup:
+                    _viewers.add("group_%d" % lrole.usergroup.id)
 
-                    if viewusergroup:
-                        _viewers.add("group_%d" % viewusergroup.id)
+            result.append(list(_viewers))
 
-        return list(_viewers)
+        return result
 
     @property
     def acquire_global_roles(self):
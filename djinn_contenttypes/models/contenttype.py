@@ -0,0 +1,37 @@
+from django.contrib.contenttypes.models import ContentType
+
+
+# Content type id per model class. Cleared after migrations, since
+# content types may have been recreated (i.e. when flushing test
+# databases).
+#
+_CT_IDS = {}
+
+
+def get_ct_id(obj):
+
+    """ Return the content type id for the model class or instance. This
+    is looked up only once per class. """
+
+    model = obj if isinstance(obj, type) else obj.__class__
+
+    try:
+        return _CT_IDS[model]
+    except KeyError:
+        ct_id = _CT_IDS[model] = ContentType.objects.get_for_model(model).id
+        return ct_id
+
+
+def clear_ct_ids(**kwargs):
+
+    _CT_IDS.clear()
+
+
+class ContentTypeId(object):
+
+    """ Class attribute that holds the id of the content type of the
+    model, so filtering on content type does not require a lookup. """
+
+    def __get__(self, instance, owner):
+
+        return get_ct_id(owner)
@@ -1,7 +1,10 @@
-from django.db import models
+from datetime import datetime
+from django.db import models, connections, router, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from djinn_contenttypes.models.contenttype import get_ct_id
 
 
 CREATED = 1
@@ -13,42 +16,221 @@ UNPUBLISHED = 4
 STATUS_MAP = ["", "created", "changed", "published", "unpublished"]
 
 
+class HistoryBuffer(object):
+
+    """ History entries logged within a transaction (or savepoint), that
+    are written with a single insert once the transaction commits. The
+    buffer is registered with transaction.on_commit, so if the
+    transaction is rolled back, the entries are dropped with it. """
+
+    def __init__(self, manager, using):
+
+        self.manager = manager
+        self.using = using
+        self.sids = list(connections[using].savepoint_ids)
+        self.entries = []
+
+        transaction.on_commit(self.flush, using=using)
+
+    @property
+    def is_live(self):
+
+        """ Are we still waiting for the commit? If not, we have either
+        been flushed, or rolled back. """
+
+        return self.flush in [callback[1] for callback in
+                              connections[self.using].run_on_commit]
+
+    def add(self, entry):
+
+        """ Add entry. Multiple 'changed' entries for the same object are
+        coalesced into one. """
+
+        if entry.status_flag == CHANGED:
+            for pending in self.entries:
+                if pending.status_flag == CHANGED and \
+                        pending.object_ct_id == entry.object_ct_id and \
+                        pending.object_id == entry.object_id:
+                    pending.date = entry.date
+                    pending.user = entry.user
+                    pending.change_message = entry.change_message
+                    return
+
+        self.entries.append(entry)
+
+    def flush(self):
+
+        entries, self.entries = self.entries, []
+
+        if entries:
+            self.manager.using(self.using).bulk_create(entries)
+
+
 class HistoryManager(models.Manager):
 
-    def log(self, instance, status_flag, user=None, change_message=''):
+    def _buffers(self, using=None):
+
+        """ Live buffers for the connection. Connections are thread
+        local, so the buffers are too. """
+
+        connection = connections[using or router.db_for_write(self.model)]
+
+        buffers = [buf for buf in getattr(connection, "_history_buffers", [])
+                   if buf.is_live]
+        connection._history_buffers = buffers
+
+        return buffers
+
+    def _pending(self, instance):
+
+        """ Entries for instance that have not been written yet, oldest
+        first """
+
+        ct_id = get_ct_id(instance)
+
+        return [entry for buf in self._buffers() for entry in buf.entries
+                if entry.object_ct_id == ct_id and
+                entry.object_id == instance.id]
 
-        entry = self.model(
+    def _write(self, entries):
+
+        """ Write entries when the current transaction commits. Outside
+        of a transaction, write them straight away. """
+
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+
+        # The publication state is written right away, so it is rolled
+        # back along with the transaction if need be.
+        #
+        for entry in entries:
+            if entry.status_flag in (PUBLISHED, UNPUBLISHED):
+                PublicationState.objects.record(entry)
+
+        if not connection.in_atomic_block:
+            self.using(using).bulk_create(entries)
+            return
+
+        buffers = self._buffers(using)
+
+        if buffers and buffers[-1].sids == connection.savepoint_ids:
+            buf = buffers[-1]
+        else:
+            buf = HistoryBuffer(self, using)
+            buffers.append(buf)
+
+        for entry in entries:
+            buf.add(entry)
+
+    def _entry(self, instance, status_flag, user=None, change_message=''):
+
+        return self.model(
+            date=timezone.now(),
             user=user,
             object_id=instance.id,
-            object_ct=ContentType.objects.get_for_model(instance),
+            object_ct_id=get_ct_id(instance),
             status_flag=status_flag,
             change_message=change_message)
-        entry.save()
+
+    def log(self, instance, status_flag, user=None, change_message=''):
+
+        self._write([self._entry(instance, status_flag, user=user,
+                                 change_message=change_message)])
+
+    def bulk_log(self, entries, change_message=''):
+
+        """ Log many entries with a single insert. Entries are tuples of
+        (instance, status_flag, user). """
+
+        self._write([
+            self._entry(instance, status_flag, user=user,
+                        change_message=change_message)
+            for (instance, status_flag, user) in entries])
 
     def get_last(self, instance, *flags, **kwargs):
 
+        pending = [entry for entry in self._pending(instance)
+                   if not flags or entry.status_flag in flags]
+
         _filter = {
             'object_id': instance.id,
-            'object_ct': ContentType.objects.get_for_model(instance)}
+            'object_ct_id': get_ct_id(instance)}
 
         if flags:
             _filter['status_flag__in'] = flags
 
-        # NB: ordering is already on -date, so get _first_ here!
-        #
-        try:
-            if kwargs.get("as_flag"):
-                return self.filter(**_filter).first().status_flag
-            else:
-                return self.filter(**_filter).first()
-        except:
+        if pending:
+            entry = pending[-1]
+        else:
+            entry = self.filter(**_filter).order_by("-date", "-id").first()
+
+        if entry is None:
             return None
+        elif kwargs.get("as_flag"):
+            return entry.status_flag
+        else:
+            return entry
+
+    def get_last_flags(self, model, ids, *flags):
+
+        """ Like get_last with as_flag set, but for many objects of the
+        same model at once. Returns a dict of object id to flag. Objects
+        without (matching) history are left out. """
+
+        ct_id = get_ct_id(model)
+
+        _filter = {
+            'object_id__in': ids,
+            'object_ct_id': ct_id}
+
+        if flags:
+            _filter['status_flag__in'] = flags
+
+        last = {}
+
+        for object_id, flag in self.filter(**_filter).order_by(
+                "object_id", "-date", "-id").values_list(
+                    "object_id", "status_flag"):
+            last.setdefault(object_id, flag)
+
+        ids = set(ids)
+
+        for buf in self._buffers():
+            for entry in buf.entries:
+                if entry.object_ct_id == ct_id and entry.object_id in ids \
+                        and (not flags or entry.status_flag in flags):
+                    last[entry.object_id] = entry.status_flag
+
+        return last
+
+    def get_publication_flag(self, instance):
+
+        """ Last PUBLISHED or UNPUBLISHED flag for instance, or None if
+        it has never been published. This is the same as get_last with
+        these flags and as_flag set, but a lot cheaper. """
+
+        return PublicationState.objects.filter(
+            object_ct_id=get_ct_id(instance),
+            object_id=instance.id).values_list(
+                "status_flag", flat=True).first()
+
+    def get_publication_flags(self, model, ids):
+
+        """ get_publication_flag for many objects of the same model """
+
+        return dict(PublicationState.objects.filter(
+            object_ct_id=get_ct_id(model),
+            object_id__in=ids).values_list("object_id", "status_flag"))
 
     def has_been(self, instance, *flags):
 
+        if [entry for entry in self._pending(instance)
+                if not flags or entry.status_flag in flags]:
+            return True
+
         _filter = {
             'object_id': instance.id,
-            'object_ct': ContentType.objects.get_for_model(instance)}
+            'object_ct_id': get_ct_id(instance)}
 
         if flags:
             _filter['status_flag__in'] = flags
@@ -57,18 +239,26 @@ class HistoryManager(models.Manager):
 
     def delete_instance_log(self, instance):
 
+        pending = self._pending(instance)
+
+        for buf in self._buffers():
+            buf.entries = [entry for entry in buf.entries
+                           if entry not in pending]
+
         _filter = {
             'object_id': instance.id,
-            'object_ct': ContentType.objects.get_for_model(instance)}
+            'object_ct_id': get_ct_id(instance)}
 
         self.filter(**_filter).delete()
+        PublicationState.objects.filter(**_filter).delete()
 
 
 class History(models.Model):
 
     """ status history of content """
 
-    date = models.DateTimeField(auto_now_add=True)
+    # Set when logged, not when written: entries may be buffered
+    date = models.DateTimeField(default=timezone.now, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
     object_ct = models.ForeignKey(ContentType, on_delete=models.PROTECT)
     object_id = models.PositiveIntegerField()
@@ -97,3 +287,92 @@ class History(models.Model):
 
         app_label = "djinn_contenttypes"
         ordering = ["-date"]
+        indexes = [
+            models.Index(fields=["object_ct", "object_id", "-date"],
+                         name="history_object_date_idx"),
+        ]
+
+
+class PublicationStateManager(models.Manager):
+
+    def record(self, entry):
+
+        """ Record the flag of the PUBLISHED/UNPUBLISHED history entry.
+        Concurrent writers may both find no row to update: the insert
+        then ignores the conflict, and the update is done again so the
+        last writer wins. """
+
+        state = self.filter(object_ct_id=entry.object_ct_id,
+                            object_id=entry.object_id)
+
+        if state.update(status_flag=entry.status_flag, date=datetime.now()):
+            return
+
+        self.bulk_create(
+            [self.model(object_ct_id=entry.object_ct_id,
+                        object_id=entry.object_id,
+                        status_flag=entry.status_flag)],
+            ignore_conflicts=True)
+
+        state.update(status_flag=entry.status_flag, date=datetime.now())
+
+
+class PublicationState(models.Model):
+
+    """ Last publication flag (PUBLISHED or UNPUBLISHED) per content
+    object. This is what the History would tell us, but without
+    scanning it. """
+
+    object_ct = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    object_id = models.PositiveIntegerField()
+    status_flag = models.PositiveSmallIntegerField()
+    date = models.DateTimeField(auto_now=True)
+
+    objects = PublicationStateManager()
+
+    class Meta:
+
+        app_label = "djinn_contenttypes"
+        unique_together = ("object_ct", "object_id")
+
+
+def backfill_publication_state(history_model, state_model, batch_size=1000):
+
+    """ (Re)build the publication state from the history. The models are
+    passed in, so this can be used from migrations too. Returns the
+    number of objects with a publication state.
+
+    This runs in a single transaction, so that on a live site the post
+    save handling never sees the table empty, and would take published
+    content for never published. """
+
+    with transaction.atomic(using=router.db_for_write(state_model)):
+
+        state_model.objects.all().delete()
+
+        last_key = None
+        count = 0
+        states = []
+
+        for ct_id, object_id, status_flag in history_model.objects.filter(
+                status_flag__in=[PUBLISHED, UNPUBLISHED]).order_by(
+                    "object_ct", "object_id", "-date", "-id").values_list(
+                        "object_ct", "object_id", "status_flag").iterator():
+
+            # Ordered by object, latest first, so skip all but the first
+            #
+            if (ct_id, object_id) == last_key:
+                continue
+
+            last_key = (ct_id, object_id)
+            count += 1
+            states.append(state_model(object_ct_id=ct_id, object_id=object_id,
+                                      status_flag=status_flag))
+
+            if len(states) >= batch_size:
+                state_model.objects.bulk_create(states)
+                states = []
+
+        state_model.objects.bulk_create(states)
+
+    return count
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from django.db import models, connection
+from django.contrib.contenttypes.models import ContentType
+from djinn_contenttypes.settings import SEARCH_INDEX_QUEUE_MAX_ATTEMPTS
+
+
+class IndexQueueManager(models.Manager):
+
+    def enqueue(self, ct_id, object_id):
+
+        """ Queue the object, unless it's queued already. An object that
+        failed to index before is given a new chance. """
+
+        self.bulk_create(
+            [self.model(object_ct_id=ct_id, object_id=object_id)],
+            ignore_conflicts=True)
+
+        self.filter(object_ct_id=ct_id, object_id=object_id,
+                    attempts__gt=0).update(
+                        attempts=0, next_attempt=datetime.now())
+
+    def due(self, max_attempts=SEARCH_INDEX_QUEUE_MAX_ATTEMPTS):
+
+        return self.filter(
+            attempts__lt=max_attempts,
+            next_attempt__lte=datetime.now()).order_by("id")
+
+    def claim(self, batch_size=100,
+              max_attempts=SEARCH_INDEX_QUEUE_MAX_ATTEMPTS):
+
+        """ Return a batch of due entries. Call within a transaction: the
+        entries are locked until it ends, where the database supports
+        it. Remove the entries that were indexed with done, and call
+        failed for the others. """
+
+        entries = self.due(max_attempts)
+
+        if connection.features.has_select_for_update_skip_locked:
+            entries = entries.select_for_update(skip_locked=True)
+
+        return list(entries[:batch_size])
+
+    def done(self, entries):
+
+        self.filter(id__in=[entry.id for entry in entries]).delete()
+
+    def failed(self, entry, exc):
+
+        """ Try entry again later, with exponential backoff. After
+        max_attempts the entry stays in the queue, but is no longer due,
+        until the object is queued again. """
+
+        entry.attempts += 1
+        entry.last_error = repr(exc)
+        entry.next_attempt = datetime.now() + timedelta(
+            minutes=2 ** entry.attempts)
+        entry.save()
+
+
+class IndexQueue(models.Model):
+
+    """ Content waiting to be (re)indexed by the process_index_queue
+    command """
+
+    object_ct = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    queued = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=datetime.now, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    objects = IndexQueueManager()
+
+    class Meta:
+
+        app_label = "djinn_contenttypes"
+        unique_together = ("object_ct", "object_id")
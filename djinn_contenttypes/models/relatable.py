@@ -1,15 +1,214 @@
 import logging
-from django.db import models
+from collections import namedtuple
+from django.db import models, connections, router
+from django.db.models import Q
 from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
 
 
 LOG = logging.getLogger("djinn_contenttypes")
 
+# Databases that can do WITH RECURSIVE queries
+#
+RECURSIVE_CTE_VENDORS = ("postgresql", "sqlite")
+
+# Result of RelatableMixin.get_related_graph. Nodes maps (content type id,
+# object id) to the number of hops from the start, edges is a list of
+# (source node, target node, relation type, hops) tuples.
+#
+RelationGraph = namedtuple("RelationGraph", ["nodes", "edges"])
+
+# First find the distance of every node up to depth - 1 hops away, then
+# take the edges leaving those nodes. The recursion is over nodes, not
+# paths, so it yields at most one row per node and hop, however many
+# paths lead there.
+#
+GRAPH_SQL = """
+WITH RECURSIVE reach(ct, id, hop) AS (
+    SELECT DISTINCT r.%(src_ct)s, r.%(src_id)s, 0
+    FROM %(table)s r
+    WHERE r.%(src_ct)s = %%s AND r.%(src_id)s = %%s
+  UNION
+    SELECT r.%(tgt_ct)s, r.%(tgt_id)s, g.hop + 1
+    FROM %(table)s r
+    JOIN reach g ON r.%(src_ct)s = g.ct AND r.%(src_id)s = g.id
+    WHERE g.hop + 1 < %%s %(type_filter)s
+),
+nodes(ct, id, hop) AS (
+    SELECT ct, id, MIN(hop) FROM reach GROUP BY ct, id
+)
+SELECT r.%(src_ct)s, r.%(src_id)s, r.%(tgt_ct)s, r.%(tgt_id)s,
+       r.%(relation_type)s, n.hop + 1
+FROM %(table)s r
+JOIN nodes n ON r.%(src_ct)s = n.ct AND r.%(src_id)s = n.id
+WHERE 1 = 1 %(type_filter)s
+ORDER BY n.hop + 1
+"""
+
+
+def _resolve(relations, inverse=False):
+
+    """ Return (relation, object) tuples for the relations, where object
+    is the target of the relation, or the source if inverse is set. The
+    objects are fetched with one query per content type. If the object
+    is no longer there, it is None. """
+
+    if inverse:
+        ct_attr, id_attr = "src_content_type_id", "src_object_id"
+    else:
+        ct_attr, id_attr = "tgt_content_type_id", "tgt_object_id"
+
+    by_ct = {}
+
+    for rel in relations:
+        by_ct.setdefault(getattr(rel, ct_attr), set()).add(
+            getattr(rel, id_attr))
+
+    objects = {}
+
+    for ct_id, ids in by_ct.items():
+
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+
+        if model is None:
+            continue
+
+        to_python = model._meta.pk.to_python
+
+        for pk, obj in model._default_manager.in_bulk(
+                [to_python(_id) for _id in ids]).items():
+            objects[(ct_id, pk)] = obj
+
+    resolved = []
+
+    for rel in relations:
+
+        ct_id = getattr(rel, ct_attr)
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        obj = None
+
+        if model is not None:
+            obj = objects.get(
+                (ct_id, model._meta.pk.to_python(getattr(rel, id_attr))))
+
+        resolved.append((rel, obj))
+
+    return resolved
+
+
+def resolve_relations(relations, inverse=False):
+
+    """ Return the targets of the relations (or the sources, if inverse
+    is set) in the order of the relations. Targets are fetched with one
+    query per content type. Relations that point to content that is no
+    longer there are skipped, and logged so they can be cleaned up. """
+
+    related = []
+    broken = []
+
+    for rel, obj in _resolve(list(relations), inverse=inverse):
+
+        if obj is None:
+            broken.append(rel.pk)
+        else:
+            related.append(obj)
+
+    if broken:
+        LOG.warning("Broken relations, need cleaning up: %s", broken)
+
+    return related
+
+
+def prefetch_relations(objects, relation_types=None, inverse=False):
+
+    """ Load the related content for all objects at once: one query for
+    the relations of all objects, and one per content type of the
+    related content. The result is kept on the objects, so that
+    subsequent calls to get_related are served from memory. Use this for
+    lists of content that show their related content. If relation_types
+    is given, only get_related for these types is served. """
+
+    objects = [obj for obj in objects if obj.id]
+
+    if not objects:
+        return
+
+    if inverse:
+        ct_field, id_field = "tgt_content_type", "tgt_object_id"
+    else:
+        ct_field, id_field = "src_content_type", "src_object_id"
+
+    # Determine content type once per class
+    #
+    by_ct = {}
+    cts = {}
+
+    for obj in objects:
+        if obj.__class__ not in cts:
+            cts[obj.__class__] = obj.ct_id
+        by_ct.setdefault(cts[obj.__class__], []).append(obj)
+
+    _filter = Q()
+
+    for ct_id, instances in by_ct.items():
+        _filter |= Q(**{"%s_id" % ct_field: ct_id,
+                        "%s__in" % id_field: [obj.id for obj in instances]})
+
+    relations = objects[0].relation_model.objects.filter(_filter)
+
+    if relation_types:
+        relations = relations.filter(relation_type__in=relation_types)
+
+    per_object = {}
+
+    for rel, related in _resolve(list(relations), inverse=inverse):
+        key = (getattr(rel, "%s_id" % ct_field), int(getattr(rel, id_field)))
+        per_object.setdefault(key, []).append((rel, related))
+
+    for obj in objects:
+        prefetched = obj.__dict__.setdefault("_prefetched_relations", {})
+        prefetched[bool(inverse)] = (
+            set(relation_types) if relation_types else None,
+            per_object.get((cts[obj.__class__], obj.id), []))
+
+
+def bulk_rm_all_relations(objects):
+
+    """ Like rm_all_relations for a list of objects: remove all relations
+    from and to the objects, with a single delete """
+
+    objects = [obj for obj in objects if obj.id]
+
+    if not objects:
+        return
+
+    by_ct = {}
+
+    for obj in objects:
+        by_ct.setdefault(obj.ct_id, []).append(obj.id)
+        obj.__dict__.pop("_prefetched_relations", None)
+
+    _filter = Q()
+
+    for ct_id, ids in by_ct.items():
+        _filter |= Q(src_content_type_id=ct_id, src_object_id__in=ids)
+        _filter |= Q(tgt_content_type_id=ct_id, tgt_object_id__in=ids)
+
+    objects[0].relation_model.objects.filter(_filter).delete()
+
 
 class RelatableMixin(object):
 
     """ Mixin class that enables relations."""
 
+    @property
+    def ct_id(self):
+
+        """ Content type id. Content classes provide this as a class
+        attribute, see BaseContent.ct_id """
+
+        return self.ct_class.id
+
     @property
     def relation_model(self):
 
@@ -19,32 +218,28 @@ class RelatableMixin(object):
 
     def get_related(self, relation_type=None, inverse=False):
 
-        """ Return all related content. This is a costly operation, so
-        use it wisely..."""
+        """ Return all related content. Related content is fetched with
+        one query per content type, see resolve_relations. If the
+        relations have been prefetched, no queries are needed at all (see
+        prefetch_relations)."""
+
+        prefetched = self.__dict__.get("_prefetched_relations", {}).get(
+            bool(inverse))
+
+        if prefetched is not None and (prefetched[0] is None or
+                                       relation_type in prefetched[0]):
+
+            return [related for (rel, related) in prefetched[1]
+                    if related is not None and
+                    (not relation_type or rel.relation_type == relation_type)]
 
         if relation_type:
             relations = self.get_relations(relation_type_list=[relation_type],
                                            inverse=inverse)
         else:
-            relations = self.get_relations()
-
-        related = []
-
-        for rel in relations:
-            try:
-                if inverse:
-                    relation_source = rel.get_src()
-                    relation_source._meta  # force a check
-                    related.append(relation_source)
-                else:
-                    relation_target = rel.get_tgt()
-                    relation_target._meta
-                    related.append(relation_target)
-            except:
-                LOG.warn("Cleaning up broken relation %s", rel)
-                rel.delete()
-
-        return related
+            relations = self.get_relations(inverse=inverse)
+
+        return resolve_relations(relations, inverse=inverse)
 
     def get_relations(self, relation_type_list=None, target_type=None,
                       inverse=False):
@@ -61,10 +256,10 @@ class RelatableMixin(object):
             relation_type_list = []
 
         if not inverse:
-            _filter = {'src_content_type': self.ct_class,
+            _filter = {'src_content_type_id': self.ct_id,
                        'src_object_id': self.id}
         else:
-            _filter = {'tgt_content_type': self.ct_class,
+            _filter = {'tgt_content_type_id': self.ct_id,
                        'tgt_object_id': self.id}
 
         if len(relation_type_list):
@@ -75,6 +270,105 @@ class RelatableMixin(object):
 
         return self.relation_model.objects.filter(**_filter)
 
+    def get_related_graph(self, depth=2, relation_types=None):
+
+        """ Follow relations up to depth hops away from this object. Nodes
+        are visited only once, at the smallest distance, but all edges
+        are kept, so cycles can be detected. Returns a RelationGraph.
+
+        On databases that support it, this is a single recursive query.
+        Otherwise it takes one query per hop."""
+
+        start = (self.ct_id, self.id)
+
+        if connections[router.db_for_read(self.relation_model)].vendor \
+                in RECURSIVE_CTE_VENDORS:
+            rows = self._graph_rows_cte(start, depth, relation_types)
+        else:
+            rows = self._graph_rows_bfs(start, depth, relation_types)
+
+        nodes = {start: 0}
+        edges = []
+
+        for src_ct, src_id, tgt_ct, tgt_id, relation_type, hop in rows:
+
+            tgt = (tgt_ct, int(tgt_id))
+
+            edges.append(((src_ct, int(src_id)), tgt, relation_type, hop))
+            nodes[tgt] = min(nodes.get(tgt, hop), hop)
+
+        return RelationGraph(nodes, edges)
+
+    def _graph_rows_cte(self, start, depth, relation_types):
+
+        model = self.relation_model
+        column = lambda name: model._meta.get_field(name).column
+        params = [start[0], start[1], depth]
+        type_filter = ""
+
+        if relation_types:
+            type_filter = "AND r.%s IN (%s)" % (
+                column("relation_type"), ", ".join(["%s"] * len(
+                    relation_types)))
+            params.extend(relation_types)
+            params.extend(relation_types)
+
+        sql = GRAPH_SQL % {
+            'table': model._meta.db_table,
+            'src_ct': column("src_content_type"),
+            'src_id': column("src_object_id"),
+            'tgt_ct': column("tgt_content_type"),
+            'tgt_id': column("tgt_object_id"),
+            'relation_type': column("relation_type"),
+            'type_filter': type_filter}
+
+        with connections[router.db_for_read(model)].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _graph_rows_bfs(self, start, depth, relation_types):
+
+        """ Breadth first: one query for all nodes at the same hop """
+
+        visited = set([start])
+        frontier = [start]
+        rows = []
+
+        for hop in range(1, depth + 1):
+
+            if not frontier:
+                break
+
+            by_ct = {}
+
+            for ct_id, obj_id in frontier:
+                by_ct.setdefault(ct_id, []).append(obj_id)
+
+            _filter = Q()
+
+            for ct_id, ids in by_ct.items():
+                _filter |= Q(src_content_type_id=ct_id, src_object_id__in=ids)
+
+            relations = self.relation_model.objects.filter(_filter)
+
+            if relation_types:
+                relations = relations.filter(relation_type__in=relation_types)
+
+            frontier = []
+
+            for row in relations.values_list(
+                    "src_content_type_id", "src_object_id",
+                    "tgt_content_type_id", "tgt_object_id", "relation_type"):
+
+                rows.append(row + (hop,))
+                tgt = (row[2], int(row[3]))
+
+                if tgt not in visited:
+                    visited.add(tgt)
+                    frontier.append(tgt)
+
+        return rows
+
     def add_relation(self, relation_type, target, unique=True):
 
         """ Add relation with given type with target as receiving end.
@@ -83,11 +377,13 @@ class RelatableMixin(object):
         if unique and self.has_relation(relation_type, target):
             return None
 
+        self.__dict__.pop("_prefetched_relations", None)
+
         return self.relation_model.objects.create(
-            src_content_type=self.ct_class,
+            src_content_type_id=self.ct_id,
             src_object_id=self.id,
             relation_type=relation_type,
-            tgt_content_type=target.ct_class,
+            tgt_content_type_id=target.ct_id,
             tgt_object_id=target.id)
 
     def has_relation(self, relation_type, target=None, inverse=False):
@@ -101,21 +397,21 @@ class RelatableMixin(object):
 
         if inverse:
             _filter.update(
-                {'tgt_content_type': self.ct_class,
+                {'tgt_content_type_id': self.ct_id,
                  'tgt_object_id': self.id})
         else:
             _filter.update(
-                {'src_content_type': self.ct_class,
+                {'src_content_type_id': self.ct_id,
                  'src_object_id': self.id})
 
         if target:
             if inverse:
                 _filter.update(
-                    {'src_content_type': target.ct_class,
+                    {'src_content_type_id': target.ct_id,
                      'src_object_id': target.id})
             else:
                 _filter.update(
-                    {'tgt_content_type': target.ct_class,
+                    {'tgt_content_type_id': target.ct_id,
                      'tgt_object_id': target.id})
 
         return self.relation_model.objects.filter(**_filter).exists()
@@ -125,18 +421,109 @@ class RelatableMixin(object):
         """ Remove relation with given type with target as receiving
         end."""
 
+        self.__dict__.pop("_prefetched_relations", None)
+
         self.relation_model.objects.filter(
-            src_content_type=self.ct_class,
+            src_content_type_id=self.ct_id,
             src_object_id=self.id,
             relation_type=relation_type,
-            tgt_content_type=target.ct_class,
+            tgt_content_type_id=target.ct_id,
             tgt_object_id=target.id).delete()
 
+    def _targets_filter(self, targets):
+
+        """ Filter on the target side of relations, for all targets at
+        once. Content types are determined once per class. """
+
+        cts = {}
+        by_ct = {}
+
+        for target in targets:
+            if target.__class__ not in cts:
+                cts[target.__class__] = target.ct_id
+            by_ct.setdefault(cts[target.__class__], []).append(target.id)
+
+        _filter = Q()
+
+        for ct_id, ids in by_ct.items():
+            _filter |= Q(tgt_content_type_id=ct_id, tgt_object_id__in=ids)
+
+        return _filter
+
+    def add_relations(self, relation_type, targets):
+
+        """ Add relations with given type to all targets that we do not
+        already relate to. The existing relations are checked with one
+        query, and the missing ones are created with another. Returns
+        the new relations. """
+
+        targets = list(targets)
+
+        if not targets:
+            return []
+
+        self.__dict__.pop("_prefetched_relations", None)
+
+        ct_id = self.ct_id
+
+        existing = set(self.relation_model.objects.filter(
+            self._targets_filter(targets),
+            src_content_type_id=ct_id,
+            src_object_id=self.id,
+            relation_type=relation_type).values_list(
+                "tgt_content_type_id", "tgt_object_id"))
+
+        relations = []
+
+        for target in targets:
+
+            key = (target.ct_id, target.id)
+
+            if key in existing:
+                continue
+
+            existing.add(key)
+            relations.append(self.relation_model(
+                src_content_type_id=ct_id,
+                src_object_id=self.id,
+                relation_type=relation_type,
+                tgt_content_type_id=target.ct_id,
+                tgt_object_id=target.id))
+
+        return self.relation_model.objects.bulk_create(relations)
+
+    def rm_relations(self, relation_type, targets):
+
+        """ Remove relations with given type to all targets, in one go """
+
+        targets = list(targets)
+
+        if not targets:
+            return
+
+        self.__dict__.pop("_prefetched_relations", None)
+
+        self.relation_model.objects.filter(
+            self._targets_filter(targets),
+            src_content_type_id=self.ct_id,
+            src_object_id=self.id,
+            relation_type=relation_type).delete()
+
     def rm_all_relations(self, inverse=True):
 
         """ Remove all relations. If inverse is true=ish, also remove
         relations where self is the target. """
 
+        self.__dict__.pop("_prefetched_relations", None)
+
+        self.relation_model.objects.filter(
+            src_content_type_id=self.ct_id, src_object_id=self.id).delete()
+
+        if inverse:
+            self.relation_model.objects.filter(
+                tgt_content_type_id=self.ct_id,
+                tgt_object_id=self.id).delete()
+
     def save_relations(self):
 
         """ Save all relations set for the current object """
@@ -144,6 +531,7 @@ class RelatableMixin(object):
         # if this instance has a '_relation_updater' attribute, then
         # iterate over them, and call the update method
         if hasattr(self, '_relation_updater'):
+            self.__dict__.pop("_prefetched_relations", None)
             for updater in self._relation_updater:
                 updater.update()
             # clean up, so another save won't mess up
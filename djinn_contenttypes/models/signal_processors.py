@@ -1,4 +1,5 @@
 from datetime import datetime
+from django.apps import apps
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 import django.dispatch
@@ -7,9 +8,13 @@ from djinn_contenttypes.models.publishable import PublishableContent
 from djinn_contenttypes.models.base import BaseContent
 from djinn_contenttypes.models.history import (
     CREATED, CHANGED, PUBLISHED, UNPUBLISHED, History)
+from djinn_contenttypes.scheduler import schedule_changed
+from djinn_contenttypes.fragments import invalidate_fragments
+from djinn_contenttypes.registry import CTRegistry
+from djinn_contenttypes import dispatch
+from djinn_contenttypes.profiling import profiled, section, name_signal
 from djinn_core.utils import implements
 from djinn_workflow.signals import state_change
-from djinn_workflow.utils import get_state
 
 
 unpublish = django.dispatch.Signal(providing_args=["instance"])
@@ -17,6 +22,22 @@ publish = django.dispatch.Signal(providing_args=["instance"])
 created = django.dispatch.Signal(providing_args=["instance"])
 changed = django.dispatch.Signal(providing_args=["instance"])
 
+# Within a transaction, these are sent once per instance on commit
+dispatch.coalesce(created, "content", 2)
+dispatch.coalesce(changed, "content", 1)
+dispatch.coalesce(publish, "publication", opposite=unpublish)
+dispatch.coalesce(unpublish, "publication", opposite=publish)
+
+# ...and these may be sent by the signal queue worker
+dispatch.queueable(publish, "publish")
+dispatch.queueable(unpublish, "unpublish")
+
+# ...and profiled under these names
+name_signal(created, "created")
+name_signal(changed, "changed")
+name_signal(publish, "publish")
+name_signal(unpublish, "unpublish")
+
 
 from functools import wraps
 def disable_for_loaddata(signal_handler):
@@ -49,22 +70,52 @@ def basecontent_unpublish(sender, instance, **kwargs):
                 instance.delete()
 
 
-@receiver(post_save)
+@profiled
 def basecontent_post_save(sender, instance, **kwargs):
 
-    if kwargs.get('created', False) and implements(instance, BaseContent):
-        History.objects.log(instance, CREATED, user=instance.creator)
-        created.send(sender, instance=instance)
-    elif implements(instance, BaseContent):
-        History.objects.log(instance, CHANGED, user=instance.changed_by)
-        changed.send(sender, instance=instance)
+    """ Connected per BaseContent sender, see connect_content_signals """
 
+    if kwargs.get('created', False):
+        with section("history"):
+            History.objects.log(instance, CREATED, user=instance.creator)
+        dispatch.send(created, sender, instance)
+    else:
+        with section("history"):
+            History.objects.log(instance, CHANGED, user=instance.changed_by)
+        dispatch.send(changed, sender, instance)
 
-@receiver(post_delete)
+
+@profiled
 def basecontent_post_delete(sender, instance, **kwargs):
 
+    """ Connected per BaseContent sender, see connect_content_signals """
+
+    History.objects.delete_instance_log(instance)
+    invalidate_fragments(instance)
+
+
+@receiver(created)
+@receiver(changed)
+@receiver(publish)
+@receiver(unpublish)
+def basecontent_invalidate_fragments(sender, instance, **kwargs):
+
+    """ Cached renderings of the instance are no longer valid """
+
+    invalidate_fragments(instance)
+
+
+@receiver(state_change)
+@profiled
+def basecontent_state_change(sender, instance, **kwargs):
+
+    """ The workflow state is part of the visibility snapshot, so drop
+    it. This receiver needs to be connected before publishable_state_change.
+    """
+
     if implements(instance, BaseContent):
-        History.objects.delete_instance_log(instance)
+        instance.invalidate_visibility()
+        invalidate_fragments(instance)
 
 
 @receiver(state_change)
@@ -78,10 +129,11 @@ def publishable_state_change(sender, instance, **kwargs):
 
 
 #MJB
-@receiver(post_save)
+@profiled
 def publishable_post_save(sender, instance, **kwargs):
 
-    """Publishable post save hook. If the content is new and 'is_public'
+    """Publishable post save hook, connected per PublishableContent sender
+    and called on state change. If the content is new and 'is_public'
     is true:
     * if  there is no history of publishing, send publish with first_edition
       flag.
@@ -93,6 +145,8 @@ def publishable_post_save(sender, instance, **kwargs):
 
     if implements(instance, PublishableContent):
 
+        schedule_changed(instance)
+
         # MJB 20190430 Pagina plaatsen in gesloten groep leverde helemaal geen
         # timeline-entries meer op. Zelfs niet voor de plaatser zelf.
         # Probleem zat in de is_public method die in de Base class kijkt of
@@ -100,26 +154,31 @@ def publishable_post_save(sender, instance, **kwargs):
         # False, maar hier moet gekeken worden naar de published status
         # (i.c.m. is_tmp)
         # if instance.is_public:
-        if instance.is_published and not instance.is_tmp and \
-                get_state(instance).name != "private" and not instance.is_deleted:
+        with section("visibility"):
+            public = instance.is_published and not instance.is_tmp and \
+                instance.visibility.state != "private" and \
+                not instance.is_deleted
+
+        with section("publication_flag"):
+            last_state = History.objects.get_publication_flag(instance)
+
+        if public:
 
             changed = False
 
             # Have we not been published before?
             #
 
-            if not History.objects.has_been(instance, PUBLISHED, UNPUBLISHED):
+            if last_state is None:
 
-                publish.send(sender, instance=instance, first_edition=True)
+                dispatch.send(publish, sender, instance, first_edition=True)
                 changed = True
 
             # Yes we have. But maybe currently we're unpublished?
             #
-            elif History.objects.get_last(
-                    instance, PUBLISHED, UNPUBLISHED,
-                    as_flag=True) == UNPUBLISHED:
+            elif last_state == UNPUBLISHED:
 
-                publish.send(sender, instance=instance)
+                dispatch.send(publish, sender, instance)
                 changed = True
 
             if changed:
@@ -132,13 +191,9 @@ def publishable_post_save(sender, instance, **kwargs):
             # We're are not public. So if the last state was
             # 'published', actively unpublish.
             #
-            last_state = History.objects.get_last(
-                instance, PUBLISHED, UNPUBLISHED,
-                as_flag=True)
-
             if last_state == PUBLISHED:
 
-                unpublish.send(sender, instance=instance)
+                dispatch.send(unpublish, sender, instance)
                 instance.__class__.objects.filter(pk=instance.pk).update(
                     unpublish_notified=True)
 
@@ -147,3 +202,48 @@ def publishable_post_save(sender, instance, **kwargs):
                 if not instance.is_deleted:
                     History.objects.log(instance, UNPUBLISHED,
                                         user=instance.changed_by)
+
+
+def connect_content_signals(model):
+
+    """ Connect the post_save and post_delete handlers for model, if it is
+    content. The handlers are connected per sender, so saving any other
+    model doesn't call them at all. Connecting twice is harmless. """
+
+    if not (isinstance(model, type) and issubclass(model, BaseContent)) \
+            or model._meta.abstract:
+        return
+
+    label = model._meta.label_lower
+
+    # Order matters: history of creation goes before publication
+    post_save.connect(basecontent_post_save, sender=model,
+                      dispatch_uid="basecontent_post_save_%s" % label)
+
+    if issubclass(model, PublishableContent):
+        post_save.connect(publishable_post_save, sender=model,
+                          dispatch_uid="publishable_post_save_%s" % label)
+
+    post_delete.connect(basecontent_post_delete, sender=model,
+                        dispatch_uid="basecontent_post_delete_%s" % label)
+
+
+def connect_all_content_signals():
+
+    """ Connect handlers for all registered content types, and any other
+    BaseContent models that are installed """
+
+    models = set(apps.get_models())
+
+    for name in CTRegistry.list_types():
+        models.add(CTRegistry.get(name).get('class'))
+
+    for model in models:
+        connect_content_signals(model)
+
+
+def registered(name, details):
+
+    """ Registry hook for types registered after app ready """
+
+    connect_content_signals(details.get('class'))
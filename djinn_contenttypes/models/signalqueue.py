@@ -0,0 +1,111 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from django.db import models, transaction, connection
+from django.contrib.contenttypes.models import ContentType
+from djinn_contenttypes.models.contenttype import get_ct_id
+from djinn_contenttypes.settings import SIGNAL_QUEUE_MAX_ATTEMPTS
+
+
+LOG = logging.getLogger("djinn_contenttypes")
+
+
+class QueuedSignalManager(models.Manager):
+
+    def enqueue(self, name, instance, kwargs=None):
+
+        """ Queue signal name for instance, see dispatch.queueable """
+
+        return self.create(
+            signal=name,
+            object_ct_id=get_ct_id(instance),
+            object_id=instance.pk,
+            kwargs=json.dumps(kwargs or {}))
+
+    def due(self, max_attempts=SIGNAL_QUEUE_MAX_ATTEMPTS):
+
+        return self.filter(
+            attempts__lt=max_attempts,
+            next_attempt__lte=datetime.now()).order_by("id")
+
+    def process(self, batch_size=100, max_attempts=SIGNAL_QUEUE_MAX_ATTEMPTS):
+
+        """ Send a batch of due signals. Sent signals are removed, failed
+        ones are retried later with exponential backoff, until
+        max_attempts is reached. Workers may run in parallel where the
+        database supports skipping locked rows. Returns the tuple (sent,
+        failed). """
+
+        # Import runtime: dispatch knows the signals by name
+        from djinn_contenttypes import dispatch
+
+        sent = failed = 0
+
+        with transaction.atomic():
+
+            events = self.due(max_attempts)
+
+            if connection.features.has_select_for_update_skip_locked:
+                events = events.select_for_update(skip_locked=True)
+
+            events = list(events[:batch_size])
+
+            instances = {}
+
+            for ct_id in set(event.object_ct_id for event in events):
+                model = ContentType.objects.get_for_id(ct_id).model_class()
+                instances[ct_id] = model and model.objects.in_bulk(
+                    [event.object_id for event in events
+                     if event.object_ct_id == ct_id]) or {}
+
+            for event in events:
+
+                instance = instances[event.object_ct_id].get(event.object_id)
+
+                if instance is None:
+                    LOG.warning("Dropping %s for missing object %s:%s",
+                                event.signal, event.object_ct_id,
+                                event.object_id)
+                    event.delete()
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        dispatch.queued_signal(event.signal).send(
+                            instance.__class__, instance=instance,
+                            **json.loads(event.kwargs))
+                except Exception as exc:
+                    LOG.exception("Sending %s for %s failed", event.signal,
+                                  instance)
+                    event.attempts += 1
+                    event.last_error = repr(exc)
+                    event.next_attempt = datetime.now() + timedelta(
+                        minutes=2 ** event.attempts)
+                    event.save()
+                    failed += 1
+                else:
+                    event.delete()
+                    sent += 1
+
+        return sent, failed
+
+
+class QueuedSignal(models.Model):
+
+    """ Content signal waiting to be sent by the process_signal_queue
+    command """
+
+    signal = models.CharField(max_length=50)
+    object_ct = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    kwargs = models.TextField(default="{}")
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=datetime.now, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    objects = QueuedSignalManager()
+
+    class Meta:
+
+        app_label = "djinn_contenttypes"
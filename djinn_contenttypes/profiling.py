@@ -0,0 +1,256 @@
+""" Opt-in profiling of the content signal handling. With PROFILE_SIGNALS
+set, the signal processors and the sends of the content signals are
+timed, and the SQL queries they do are counted. A send is timed with all
+of its receivers together, under the name given with name_signal; only
+Signal.send is used, so this doesn't depend on Django internals. Samples are collected in
+the cache, so they can be inspected across processes with the
+signal_profile command. With PROFILE_SERVER_TIMING set as well, the CRUD
+views add the totals of the request as Server-Timing header (see
+views.base.ServerTimingMixin).
+
+When PROFILE_SIGNALS is not set, profiled returns the function as is,
+and section returns a shared context manager that does nothing. """
+
+import threading
+import time
+from functools import wraps
+from django.core.cache import cache
+from django.db import connection
+from djinn_contenttypes.settings import PROFILE_SIGNALS, PROFILE_SAMPLES
+
+
+CACHE_PREFIX = "djinn_profile_"
+NAMES_KEY = CACHE_PREFIX + "names"
+
+# Samples are written to the cache in batches of this size per process
+#
+FLUSH_SIZE = 50
+
+_local = threading.local()
+_lock = threading.Lock()
+_samples = {}
+
+
+class _NoSection(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SECTION = _NoSection()
+
+
+class _QueryCounter(object):
+
+    def __init__(self):
+
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+
+        self.count += 1
+
+        return execute(sql, params, many, context)
+
+
+class _Section(object):
+
+    def __init__(self, name):
+
+        self.name = name
+
+    def __enter__(self):
+
+        self.counter = _QueryCounter()
+        self.wrapper = connection.execute_wrapper(self.counter)
+        self.wrapper.__enter__()
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc):
+
+        duration = time.perf_counter() - self.start
+        self.wrapper.__exit__(*exc)
+        record(self.name, duration, self.counter.count)
+
+        return False
+
+
+def section(name):
+
+    """ Context manager to profile the enclosed code under name """
+
+    if not PROFILE_SIGNALS:
+        return _NO_SECTION
+
+    return _Section(name)
+
+
+def _name(func):
+
+    return "%s.%s" % (func.__module__, getattr(func, "__name__", func))
+
+
+def profiled(func):
+
+    """ Decorator to profile the function under its full name """
+
+    if not PROFILE_SIGNALS:
+        return func
+
+    name = _name(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+
+        with _Section(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+_signal_names = {}
+
+
+def name_signal(signal, name):
+
+    """ Profile the sends of signal under name """
+
+    _signal_names[signal] = name
+
+
+def send(signal, sender, **named):
+
+    """ Like signal.send, but profile the send """
+
+    with section("signal.%s" % _signal_names.get(signal, "unnamed")):
+        return signal.send(sender, **named)
+
+
+def record(name, duration, queries):
+
+    """ Add sample to the totals of the current request, and to the
+    samples of this process, that are written to the cache once in a
+    while """
+
+    timings = getattr(_local, "timings", None)
+
+    if timings is not None:
+        total = timings.get(name, (0, 0))
+        timings[name] = (total[0] + duration, total[1] + queries)
+
+    with _lock:
+        samples = _samples.setdefault(name, [])
+        samples.append((duration, queries))
+
+        if len(samples) < FLUSH_SIZE:
+            return
+
+        del _samples[name]
+
+    _store(name, samples)
+
+
+def _store(name, samples):
+
+    names = cache.get(NAMES_KEY) or []
+
+    if name not in names:
+        cache.set(NAMES_KEY, names + [name], None)
+
+    # Racy between processes, but good enough for statistics
+    #
+    stored = cache.get(CACHE_PREFIX + name) or []
+    cache.set(CACHE_PREFIX + name, (stored + samples)[-PROFILE_SAMPLES:],
+              None)
+
+
+def flush():
+
+    """ Write all samples of this process to the cache """
+
+    with _lock:
+        samples = dict(_samples)
+        _samples.clear()
+
+    for name, batch in samples.items():
+        _store(name, batch)
+
+
+def percentile(values, pct):
+
+    """ Percentile of the sorted list of values, nearest rank """
+
+    if not values:
+        return None
+
+    idx = max(0, min(len(values) - 1,
+                     int(round(pct / 100.0 * len(values))) - 1))
+
+    return values[idx]
+
+
+def stats():
+
+    """ Return a list of dicts with name, count, p50, p90, p99 and max
+    duration in milliseconds and the mean number of queries, slowest
+    (by p90) first """
+
+    result = []
+
+    for name in cache.get(NAMES_KEY) or []:
+
+        samples = cache.get(CACHE_PREFIX + name) or []
+
+        if not samples:
+            continue
+
+        durations = sorted(sample[0] * 1000 for sample in samples)
+
+        result.append({
+            'name': name,
+            'count': len(samples),
+            'p50': percentile(durations, 50),
+            'p90': percentile(durations, 90),
+            'p99': percentile(durations, 99),
+            'max': durations[-1],
+            'queries': sum(sample[1] for sample in samples) /
+            float(len(samples))})
+
+    return sorted(result, key=lambda row: -row['p90'])
+
+
+def reset():
+
+    for name in cache.get(NAMES_KEY) or []:
+        cache.delete(CACHE_PREFIX + name)
+
+    cache.delete(NAMES_KEY)
+
+
+def start_request():
+
+    """ Start collecting the totals of the current request """
+
+    _local.timings = {}
+
+
+def end_request():
+
+    """ Stop collecting, and return the totals of the request as value for
+    the Server-Timing header, or None if nothing was profiled """
+
+    timings, _local.timings = getattr(_local, "timings", None), None
+
+    if not timings:
+        return None
+
+    return ", ".join(
+        '%s;dur=%.2f;desc="%s (%d queries)"' % (
+            "s%d" % idx, duration * 1000, name, queries)
+        for idx, (name, (duration, queries))
+        in enumerate(sorted(timings.items())))
@@ -0,0 +1,225 @@
+""" Publishing and unpublishing of scheduled content. This is shared
+by the publish and unpublish commands and the publish scheduler.
+
+Next to the plain one-by-one way of (un)publishing, by saving each
+instance and letting the signal handlers do the work, there's a batched
+engine for large amounts of due content. This processes content in
+chunks, and does the flag updates, history logging and removal with a
+single query per chunk. Only the publish and unpublish signals are still
+sent per instance. Every chunk is a transaction of its own, and the
+signals are sent when it commits, so a chunk is either handled and
+signalled as a whole, or not at all. """
+
+from datetime import datetime
+from django.db import transaction
+from django.db.models import Q
+from djinn_contenttypes.models.base import BaseContent, bulk_local_roles
+from djinn_contenttypes.models.history import (
+    History, PUBLISHED, UNPUBLISHED)
+from djinn_contenttypes.models.publishable import PublishableContent
+from djinn_contenttypes.models.relatable import bulk_rm_all_relations
+from djinn_contenttypes.registry import CTRegistry
+
+
+def publishable_models():
+
+    """ All registered content types that are publishable """
+
+    models = []
+
+    for ctype in CTRegistry.list_by_base(PublishableContent):
+
+        model = CTRegistry.get_attr(ctype, "class")
+
+        if model not in models:
+            models.append(model)
+
+    return models
+
+
+def due_for_publish(model, now=None):
+
+    """ Content that has reached published state due to the publish_from
+    timestamp, but has not been notified as such. """
+
+    now = now or datetime.now()
+
+    return model.objects.filter(
+        publish_notified=False, publish_from__lt=now).filter(
+            Q(publish_to__isnull=True) | Q(publish_to__gt=now))
+
+
+def due_for_unpublish(model, now=None):
+
+    """ Content that is beyond the publish_to date (or not there yet)
+    and has not been notified as such. """
+
+    now = now or datetime.now()
+
+    return model.objects.filter(
+        unpublish_notified=False, publish_to__isnull=False).filter(
+            Q(publish_to__lt=now) | Q(publish_from__gt=now))
+
+
+def due_for_removal(model, now=None):
+
+    """ Tenacious content that should be removed after publish_to """
+
+    now = now or datetime.now()
+
+    return model.objects.filter(
+        remove_after_publish_to=True,
+        publish_to__isnull=False, publish_to__lt=now)
+
+
+def publish_instance(instance):
+
+    """ We just call 'save' on the instance, and let the signal handlers
+    take care of the rest. """
+
+    instance.save()
+
+
+def unpublish_instance(instance):
+
+    # be sure this unpublish is not handled again
+    instance.unpublish_notified = True
+
+    # prepare for a following publication of this instance
+    instance.publish_notified = False
+    instance.save()
+
+
+def chunked(qs, batch_size):
+
+    """ Iterate over the queryset in lists of at most batch_size
+    instances, using keyset pagination on the primary key. """
+
+    last = None
+
+    while True:
+
+        chunk_qs = qs.order_by("pk")
+
+        if last is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last)
+
+        chunk = list(chunk_qs[:batch_size].iterator())
+
+        if not chunk:
+            break
+
+        last = chunk[-1].pk
+
+        yield chunk
+
+
+def publish_chunk(model, chunk):
+
+    """ Batched version of what publishable_post_save does for content
+    that just became published. Returns the number of published
+    instances. """
+
+    # Import runtime to prevent circular imports
+    from djinn_contenttypes.models.signal_processors import publish
+    from djinn_contenttypes import dispatch
+
+    last_flags = History.objects.get_publication_flags(
+        model, [instance.pk for instance in chunk])
+
+    BaseContent.prime_visibility(chunk)
+
+    published = []
+
+    for instance in chunk:
+
+        if instance.is_tmp or instance.visibility.state == "private" or \
+                instance.visibility.deleted:
+            continue
+
+        # Have we not been published before? Or are we currently
+        # unpublished?
+        #
+        if instance.pk not in last_flags:
+            dispatch.send(publish, model, instance, first_edition=True)
+        elif last_flags[instance.pk] == UNPUBLISHED:
+            dispatch.send(publish, model, instance)
+        else:
+            continue
+
+        published.append(instance)
+
+    if published:
+        History.objects.bulk_log(
+            [(instance, PUBLISHED, instance.changed_by)
+             for instance in published])
+        model.objects.filter(
+            pk__in=[instance.pk for instance in published]).update(
+                publish_notified=True, unpublish_notified=False)
+
+    return len(published)
+
+
+def unpublish_chunk(model, chunk):
+
+    """ Batched version of unpublish_instance and the post save handling
+    that follows. Returns the number of unpublished instances. """
+
+    # Import runtime to prevent circular imports
+    from djinn_contenttypes.models.signal_processors import unpublish
+    from djinn_contenttypes import dispatch
+
+    pks = [instance.pk for instance in chunk]
+
+    last_flags = History.objects.get_publication_flags(model, pks)
+
+    unpublished = [instance for instance in chunk
+                   if last_flags.get(instance.pk) == PUBLISHED]
+
+    for instance in unpublished:
+        dispatch.send(unpublish, model, instance)
+
+    model.objects.filter(pk__in=pks).update(
+        unpublish_notified=True, publish_notified=False)
+
+    History.objects.bulk_log(
+        [(instance, UNPUBLISHED, instance.changed_by)
+         for instance in unpublished])
+
+    return len(unpublished)
+
+
+def remove_chunk(model, chunk):
+
+    """ Remove content in bulk, including the local roles and relations,
+    like BaseContent.delete does per instance. Returns the number of
+    removed instances. """
+
+    for instance in chunk:
+        instance.pre_delete()
+
+    local_roles, instance_fk = bulk_local_roles(chunk)
+    local_roles.delete()
+
+    bulk_rm_all_relations(chunk)
+
+    model.objects.filter(pk__in=[instance.pk for instance in chunk]).delete()
+
+    return len(chunk)
+
+
+def process_batched(qs, handler, batch_size):
+
+    """ Feed the queryset to the chunk handler. Returns a tuple of the
+    number of due instances and the number actually handled. """
+
+    due = handled = 0
+
+    for chunk in chunked(qs.select_related("changed_by"), batch_size):
+
+        due += len(chunk)
+
+        with transaction.atomic():
+            handled += handler(qs.model, chunk)
+
+    return due, handled
@@ -18,11 +18,31 @@ class CTRegistry(object):
       name_plural      well...
       filter_label     Label to show in filter. If empty, not shown at all.
       group_add        Whether the CT can be added to group context
+      select_related   Relations to select when loading objects in bulk, see
+                       utils.get_objects_by_ctype_ids
+      prefetch_related Relations to prefetch when loading objects in bulk
+      json_fields      Fields (or properties) to render in JSON responses. If
+                       empty, all concrete fields are rendered.
+      cache_snippet    Cache the record snippet rendered for Ajax detail
+                       requests per permission class. Defaults to False; set
+                       to True if the snippet holds no per user content.
+
+    Lookups by class, app, flag and base class use indexes that are built
+    once all types are registered (see freeze), and return tuples of
+    'full' keys.
 
     """
 
     content_types = {}
 
+    # Secondary indexes, built by freeze
+    #
+    indexes = None
+
+    # Functions called as hook(name, register_dict) upon registration
+    #
+    hooks = []
+
     @staticmethod
     def register(name, register_dict):
 
@@ -32,6 +52,123 @@ class CTRegistry(object):
         CTRegistry.content_types["%s.%s" % (register_dict['app'], name)] = \
             register_dict
 
+        # Registered after freezing. Rebuild indexes on next lookup.
+        CTRegistry.indexes = None
+
+        for hook in CTRegistry.hooks:
+            hook(name, register_dict)
+
+    @staticmethod
+    def add_hook(hook):
+
+        """ Have hook called for every type registered from now on """
+
+        if hook not in CTRegistry.hooks:
+            CTRegistry.hooks.append(hook)
+
+    @staticmethod
+    def freeze():
+
+        """ Build the lookup indexes. This is done at app ready time, and
+        again upon the first lookup after a later registration. """
+
+        # Import runtime: the models depend on the registry
+        from djinn_contenttypes.models.publishable import PublishableContent
+        from djinn_contenttypes.models.feed import FeedMixin
+
+        names = sorted(key for key in CTRegistry.content_types
+                       if "." in key)
+
+        by_class = {}
+        by_app = {}
+
+        for name in names:
+
+            details = CTRegistry.content_types[name]
+
+            if details.get('class') is not None:
+                by_class.setdefault(details['class'], name)
+
+            by_app.setdefault(details['app'], []).append(name)
+
+        indexes = {
+            'names': tuple(names),
+            'class': by_class,
+            'app': dict((app, tuple(app_names)) for (app, app_names) in
+                        by_app.items()),
+            'flag': {},
+            'base': {}
+        }
+
+        CTRegistry.indexes = indexes
+
+        for flag in ["global_add", "global_filter", "group_add",
+                     "allow_saveandedit"]:
+            CTRegistry.list_by_flag(flag)
+
+        for base in [PublishableContent, FeedMixin]:
+            CTRegistry.list_by_base(base)
+
+    @staticmethod
+    def _indexes():
+
+        if CTRegistry.indexes is None:
+            CTRegistry.freeze()
+
+        return CTRegistry.indexes
+
+    @staticmethod
+    def get_name_by_class(clazz):
+
+        """ Full name of the type registered for clazz, or None """
+
+        return CTRegistry._indexes()['class'].get(clazz)
+
+    @staticmethod
+    def get_by_class(clazz):
+
+        """ Fetch all details for the type registered for clazz """
+
+        return CTRegistry.get(CTRegistry.get_name_by_class(clazz))
+
+    @staticmethod
+    def list_by_app(app):
+
+        """ Full names of all types of the given app """
+
+        return CTRegistry._indexes()['app'].get(app, ())
+
+    @staticmethod
+    def list_by_flag(flag):
+
+        """ Full names of all types that have the given attribute set,
+        e.g. global_add """
+
+        indexes = CTRegistry._indexes()
+
+        if flag not in indexes['flag']:
+            indexes['flag'][flag] = tuple(
+                name for name in indexes['names']
+                if CTRegistry.content_types[name].get(flag))
+
+        return indexes['flag'][flag]
+
+    @staticmethod
+    def list_by_base(base):
+
+        """ Full names of all types whose class extends base, e.g.
+        PublishableContent """
+
+        indexes = CTRegistry._indexes()
+
+        if base not in indexes['base']:
+            indexes['base'][base] = tuple(
+                name for name in indexes['names']
+                if issubclass(CTRegistry.content_types[name].get(
+                    'class') or object, base))
+
+        return indexes['base'][base]
+
     @staticmethod
     def get(name):
 
@@ -53,7 +190,9 @@ class CTRegistry(object):
 
         """ Only list the 'full' keys: those with the app id and model id """
 
-        return list(filter(
-            lambda x: x not in excludes and "." in x,
-            CTRegistry.content_types.keys()
-        ))
+        names = CTRegistry._indexes()['names']
+
+        if not excludes:
+            return list(names)
+
+        return [name for name in names if name not in excludes]
@@ -0,0 +1,255 @@
+""" Due time scheduler for publishing and unpublishing content.
+
+Instead of scanning all publishable content types every cron tick, the
+scheduler keeps a priority queue of the next publish_from/publish_to
+transition of all content, and sleeps until the earliest one is due.
+Whenever scheduled content is saved, the post save hook adds the object
+to a numbered list of changes in the cache (see schedule_changed), and the
+scheduler reloads just those objects by primary key. If changes were lost,
+e.g. because the cache was cleared, everything is reloaded. The changes
+only reach the scheduler if the cache is shared between processes; with a
+local memory or dummy cache, the scheduler falls back to reloading
+everything every PUBLISH_SCHEDULER_RELOAD_SECS. """
+
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.contrib.contenttypes.models import ContentType
+from djinn_contenttypes.models.contenttype import get_ct_id
+from djinn_contenttypes.publishing import (
+    publishable_models, due_for_publish, due_for_unpublish, due_for_removal,
+    publish_instance, unpublish_instance)
+from djinn_contenttypes.settings import (
+    PUBLISH_SCHEDULER_POLL_SECS, PUBLISH_SCHEDULER_RELOAD_SECS)
+
+
+LOG = logging.getLogger("djinn_contenttypes")
+
+SCHEDULE_SEQ_KEY = "djinn_contenttypes_schedule_seq"
+SCHEDULE_CHANGE_KEY = "djinn_contenttypes_schedule_change_%d"
+
+# Reload everything if more changes than this came in since the last poll
+#
+MAX_CHANGES = 1000
+
+PUBLISH = "publish"
+UNPUBLISH = "unpublish"
+
+
+def schedule_changed(instance):
+
+    """ Tell a running scheduler that the schedule of instance changed """
+
+    if not instance.is_scheduled:
+        return
+
+    cache.add(SCHEDULE_SEQ_KEY, 0, None)
+
+    try:
+        seq = cache.incr(SCHEDULE_SEQ_KEY)
+    except ValueError:
+        # Gone already; the scheduler will notice and reload everything
+        return
+
+    cache.set(SCHEDULE_CHANGE_KEY % seq, (get_ct_id(instance), instance.pk),
+              PUBLISH_SCHEDULER_RELOAD_SECS)
+
+
+def cache_is_shared():
+
+    """ Do other processes see what we put in the cache? """
+
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+class PublishScheduler(object):
+
+    """ Priority queue of upcoming (un)publish transitions. The queue
+    only determines *when* to look at content: at that time the same
+    filters as the publish and unpublish commands are applied, so an
+    outdated entry never does any harm. """
+
+    def __init__(self, poll=PUBLISH_SCHEDULER_POLL_SECS,
+                 reload=PUBLISH_SCHEDULER_RELOAD_SECS):
+
+        self.poll = poll
+        self.reload = reload
+        self.queue = []
+        self.scheduled = {}
+        self.loaded = None
+        self.seq = None
+        self.shared_cache = cache_is_shared()
+
+    def push(self, due, action, model, pk):
+
+        """ (Re)schedule the action for the given object. Earlier entries
+        for the same object and action are skipped when popped. """
+
+        key = (model, pk, action)
+
+        if self.scheduled.get(key) == due:
+            return
+
+        self.scheduled[key] = due
+        heapq.heappush(self.queue, (due, id(model), pk, action, model))
+
+    def load(self, changes=None):
+
+        """ Load all pending transitions, or only those of the changes
+        given as {model: primary keys} """
+
+        now = datetime.now()
+
+        for model in publishable_models():
+
+            qs = model.objects.all()
+
+            if changes is not None:
+                if not changes.get(model):
+                    continue
+                qs = qs.filter(pk__in=changes[model])
+
+            for pk, publish_from in qs.filter(
+                    publish_notified=False,
+                    publish_from__isnull=False).values_list(
+                        "pk", "publish_from"):
+                self.push(publish_from, PUBLISH, model, pk)
+
+            for pk, publish_from, publish_to in qs.filter(
+                    unpublish_notified=False,
+                    publish_to__isnull=False).values_list(
+                        "pk", "publish_from", "publish_to"):
+
+                # Not published yet is unpublished as well...
+                if publish_from and publish_from > now:
+                    self.push(now, UNPUBLISH, model, pk)
+                else:
+                    self.push(publish_to, UNPUBLISH, model, pk)
+
+        if changes is None:
+            self.loaded = now
+
+    def reset(self):
+
+        """ Start over with all pending transitions """
+
+        self.seq = cache.get(SCHEDULE_SEQ_KEY) or 0
+        self.queue = []
+        self.scheduled = {}
+        self.load()
+
+    def changes(self):
+
+        """ Return the objects changed since the last call as {model:
+        primary keys}, or None if we may have missed some """
+
+        seq = cache.get(SCHEDULE_SEQ_KEY) or 0
+        last, self.seq = self.seq, seq
+
+        if last is None or seq < last or seq - last > MAX_CHANGES:
+            return None
+
+        keys = [SCHEDULE_CHANGE_KEY % num for num in range(last + 1, seq + 1)]
+        found = keys and cache.get_many(keys) or {}
+
+        if len(found) < len(keys):
+            return None
+
+        changes = {}
+
+        for ct_id, pk in found.values():
+
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+
+            if model is not None:
+                changes.setdefault(model, set()).add(pk)
+
+        return changes
+
+    def pop_due(self, now):
+
+        """ Pop all entries that are due, grouped per model and action """
+
+        due = {}
+
+        while self.queue and self.queue[0][0] <= now:
+
+            when, _id, pk, action, model = heapq.heappop(self.queue)
+
+            if self.scheduled.get((model, pk, action)) != when:
+                continue
+
+            del self.scheduled[(model, pk, action)]
+            due.setdefault((model, action), []).append(pk)
+
+        return due
+
+    def process_due(self):
+
+        now = datetime.now()
+
+        for (model, action), pks in self.pop_due(now).items():
+
+            if action == PUBLISH:
+                for instance in due_for_publish(model, now).filter(
+                        pk__in=pks):
+                    LOG.info("Publishing %s %s", model.__name__, instance.pk)
+                    publish_instance(instance)
+            else:
+                for instance in due_for_unpublish(model, now).filter(
+                        pk__in=pks):
+                    LOG.info("Unpublishing %s %s", model.__name__,
+                             instance.pk)
+                    unpublish_instance(instance)
+
+                for instance in due_for_removal(model, now).filter(
+                        pk__in=pks):
+                    instance.delete()
+
+    def timeout(self):
+
+        """ Seconds until the next transition, at most the poll time """
+
+        if not self.queue:
+            return self.poll
+
+        wait = (self.queue[0][0] - datetime.now()).total_seconds()
+
+        return min(max(wait, 0), self.poll)
+
+    def refresh(self):
+
+        """ Reload the content that changed, as told by the post save hook,
+        and everything every once in a while in case we missed changes. """
+
+        if datetime.now() - self.loaded > timedelta(seconds=self.reload):
+            self.reset()
+            return
+
+        if not self.shared_cache:
+            return
+
+        changes = self.changes()
+
+        if changes is None:
+            self.reset()
+        elif changes:
+            self.load(changes)
+
+    def run(self):
+
+        if not self.shared_cache:
+            LOG.warning("The cache is not shared between processes, so the "
+                        "publish scheduler only sees changed content when "
+                        "it reloads, every %d seconds", self.reload)
+
+        self.reset()
+
+        while True:
+            self.process_due()
+            time.sleep(self.timeout())
+            self.refresh()
@@ -0,0 +1,172 @@
+""" JSON serialization of content. Per model class, a serializer is
+compiled once: a list of (name, getter) pairs for the fields to
+serialize. The fields are taken from the 'json_fields' attribute of the
+registered type, or else all concrete fields of the model. Values are
+converted to native JSON types where possible. """
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.db import models
+from djinn_contenttypes.registry import CTRegistry
+
+
+_SERIALIZERS = {}
+
+
+def to_json(value):
+
+    """ Convert value to something json can handle """
+
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    elif isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    elif isinstance(value, models.Model):
+        return value.pk
+    elif isinstance(value, Decimal):
+        return str(value)
+    elif isinstance(value, (list, tuple, set)):
+        return [to_json(val) for val in value]
+    else:
+        return str(value)
+
+
+def _isoformat(value):
+
+    return value and value.isoformat()
+
+
+def _filename(value):
+
+    return value.name or None
+
+
+def _getter(model, name):
+
+    """ Return a function to get the JSON value for name from an
+    instance, picking the conversion by field type up front """
+
+    try:
+        field = model._meta.get_field(name)
+    except Exception:
+        field = None
+
+    if field is None:
+        return lambda obj: to_json(getattr(obj, name, None))
+    elif field.many_to_many or field.one_to_many:
+        return lambda obj: [rel.pk for rel in getattr(obj, name).all()]
+    elif not field.concrete:
+        return lambda obj: to_json(getattr(obj, name, None))
+
+    attname = field.attname
+
+    if isinstance(field, (models.DateTimeField, models.DateField,
+                          models.TimeField)):
+        convert = _isoformat
+    elif isinstance(field, models.FileField):
+        convert = _filename
+    elif field.is_relation or isinstance(
+            field, (models.IntegerField, models.BooleanField,
+                    models.FloatField, models.CharField, models.TextField)):
+        # foreign keys give their id
+        return lambda obj: getattr(obj, attname)
+    else:
+        convert = to_json
+
+    return lambda obj: convert(getattr(obj, attname))
+
+
+def get_serializer(model):
+
+    """ Return list of (name, getter) for the model. Compiled once per
+    model class. """
+
+    try:
+        return _SERIALIZERS[model]
+    except KeyError:
+        pass
+
+    names = CTRegistry.get_by_class(model).get('json_fields')
+
+    if not names:
+        names = [field.name for field in model._meta.concrete_fields]
+
+    serializer = _SERIALIZERS[model] = [
+        (name, _getter(model, name)) for name in names]
+
+    return serializer
+
+
+def serialize(obj, fields=None):
+
+    """ Return dict for model instance obj. If fields is given, only
+    serialize those fields (of the ones available). """
+
+    return dict((name, getter(obj)) for (name, getter) in
+                get_serializer(obj.__class__)
+                if not fields or name in fields)
+
+
+def json_default(obj, fields=None):
+
+    """ Use as 'default' for json.dumps """
+
+    if isinstance(obj, models.Model):
+        return serialize(obj, fields=fields)
+    elif isinstance(obj, models.QuerySet):
+        return list(obj)
+
+    return to_json(obj)
+
+
+def _jsonable(value):
+
+    """ Is the value something we want in the output? This leaves out
+    the view, forms and the like from template contexts. """
+
+    if isinstance(value, (models.Model, models.QuerySet, list, tuple,
+                          dict, str, int, float, bool, datetime, date,
+                          time, Decimal)) or value is None:
+        return True
+
+    return False
+
+
+def dumps(context, fields=None):
+
+    """ Dump the template context as JSON """
+
+    return json.dumps(
+        dict((key, value) for (key, value) in context.items()
+             if _jsonable(value)),
+        default=lambda obj: json_default(obj, fields=fields))
+
+
+def stream(context, fields=None, key="object_list"):
+
+    """ Generator for JSON output of the context, where the list under
+    key is written one item at a time. """
+
+    items = context[key]
+
+    if isinstance(items, models.QuerySet):
+        items = items.iterator()
+
+    rest = dict((_key, value) for (_key, value) in context.items()
+                if _key != key and _jsonable(value) and
+                not isinstance(value, models.QuerySet))
+
+    default = lambda obj: json_default(obj, fields=fields)
+
+    yield json.dumps(rest, default=default)[:-1]
+
+    if rest:
+        yield ", "
+
+    yield '"%s": [' % key
+
+    for idx, item in enumerate(items):
+        yield (idx and ", " or "") + json.dumps(item, default=default)
+
+    yield "]}"
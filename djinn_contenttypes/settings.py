@@ -16,3 +16,46 @@ WYSIWYG_SIZE_NAMES = getattr(
 
 IMAGESIZES_CHECKING_INTERVAL_SECS = getattr(
     settings, 'IMAGESIZES_CHECKING_INTERVAL_SECS', 7200)
+
+# Maximum time the publish scheduler sleeps before checking for changed
+# schedules, and the interval for a full reload of the schedule.
+PUBLISH_SCHEDULER_POLL_SECS = getattr(
+    settings, 'PUBLISH_SCHEDULER_POLL_SECS', 10)
+
+PUBLISH_SCHEDULER_RELOAD_SECS = getattr(
+    settings, 'PUBLISH_SCHEDULER_RELOAD_SECS', 3600)
+
+# History older than this is moved out by the archive_history command
+HISTORY_RETENTION_DAYS = getattr(settings, 'HISTORY_RETENTION_DAYS', 730)
+
+# Lifetime of cached snippet renders, see djinn_contenttypes.fragments. Set
+# to 0 to disable the fragment cache.
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+
+# Send publish and unpublish through the signal queue, to be processed by
+# the process_signal_queue command, instead of within the request.
+ASYNC_CONTENT_SIGNALS = getattr(settings, 'ASYNC_CONTENT_SIGNALS', False)
+
+# Number of times the queue worker tries to send a signal
+SIGNAL_QUEUE_MAX_ATTEMPTS = getattr(settings, 'SIGNAL_QUEUE_MAX_ATTEMPTS', 5)
+
+# Profiling of the content signal handling, see djinn_contenttypes.profiling
+PROFILE_SIGNALS = getattr(settings, 'PROFILE_SIGNALS', False)
+
+PROFILE_SERVER_TIMING = getattr(settings, 'PROFILE_SERVER_TIMING', False)
+
+# Number of samples kept per profiled function
+PROFILE_SAMPLES = getattr(settings, 'PROFILE_SAMPLES', 1000)
+
+# Queue search index updates of the CRUD views, to be processed by the
+# process_index_queue command, instead of updating the index in the request.
+# Saves of the same object within the window are queued only once.
+DEFERRED_SEARCH_INDEXING = getattr(
+    settings, 'DEFERRED_SEARCH_INDEXING', False)
+
+SEARCH_INDEX_QUEUE_WINDOW_SECS = getattr(
+    settings, 'SEARCH_INDEX_QUEUE_WINDOW_SECS', 60)
+
+# Number of times the queue worker tries to index an object
+SEARCH_INDEX_QUEUE_MAX_ATTEMPTS = getattr(
+    settings, 'SEARCH_INDEX_QUEUE_MAX_ATTEMPTS', 5)
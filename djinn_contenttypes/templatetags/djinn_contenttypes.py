@@ -10,6 +10,7 @@ from django.urls import reverse
 from djinn_core.utils import implements as _implements
 from djinn_core.utils import object_to_urn as obj_to_urn
 from djinn_core.utils import HTMLTruncate
+from djinn_contenttypes.fragments import render_fragment
 from django.template.defaultfilters import stringfilter
 from django.conf import settings
 import bleach
@@ -66,26 +67,36 @@ def cancel_action(label=None):
     return {'label': label or _("Cancel")}
 
 
-@register.inclusion_tag('djinn_contenttypes/snippets/delete_action.html')
-def delete_action(obj, label=None):
+@register.simple_tag(takes_context=True)
+def delete_action(context, obj, label=None):
 
     """ Determine delete URL and return button """
 
-    return {'url': reverse("%s_delete_%s" % (obj.app_label,
-                                             obj.ct_name),
-                           kwargs={'pk': obj.id}),
-            'label': label or _("Delete")}
+    label = label or _("Delete")
 
+    return render_fragment(
+        context, 'djinn_contenttypes/snippets/delete_action.html',
+        {'url': reverse("%s_delete_%s" % (obj.app_label,
+                                          obj.ct_name),
+                        kwargs={'pk': obj.id}),
+         'label': label},
+        obj, "delete_action", label)
 
-@register.inclusion_tag('djinn_contenttypes/snippets/edit_action.html')
-def edit_action(obj, label=None):
+
+@register.simple_tag(takes_context=True)
+def edit_action(context, obj, label=None):
 
     """ Determine edit URL and return button """
 
-    return {'url': reverse("%s_edit_%s" % (obj.app_label,
-                                           obj.ct_name),
-                           kwargs={'pk': obj.id}),
-            'label': label or _("Edit")}
+    label = label or _("Edit")
+
+    return render_fragment(
+        context, 'djinn_contenttypes/snippets/edit_action.html',
+        {'url': reverse("%s_edit_%s" % (obj.app_label,
+                                        obj.ct_name),
+                        kwargs={'pk': obj.id}),
+         'label': label},
+        obj, "edit_action", label)
 
 
 @register.filter
@@ -117,16 +128,19 @@ def object_to_urn(obj):
     return obj_to_urn(obj)
 
 
-@register.inclusion_tag('djinn_contenttypes/snippets/title.html')
-def title(obj, truncate=-1):
+@register.simple_tag(takes_context=True)
+def title(context, obj, truncate=-1):
 
     """ obj should be a regular content type for djinn """
 
-    return {'obj': obj, 'truncate': truncate}
+    return render_fragment(
+        context, 'djinn_contenttypes/snippets/title.html',
+        {'obj': obj, 'truncate': truncate}, obj, "title", truncate)
 
 
-@register.inclusion_tag('djinn_contenttypes/snippets/reference.html')
-def reference(obj, truncate=-1, cssclass='', user=None, title_url=None):
+@register.simple_tag(takes_context=True)
+def reference(context, obj, truncate=-1, cssclass='', user=None,
+              title_url=None):
 
     """ obj should be a regular content type for djinn. If cssclass is
     provided, put this on the link. """
@@ -139,8 +153,12 @@ def reference(obj, truncate=-1, cssclass='', user=None, title_url=None):
     if not title_url:
         title_url = obj.get_absolute_url()
 
-    return {'obj': obj, 'truncate': truncate, 'cssclass': cssclass,
-            'show_link': show_link, 'title_url': title_url}
+    # show_link is the permission fingerprint of the rendering
+    return render_fragment(
+        context, 'djinn_contenttypes/snippets/reference.html',
+        {'obj': obj, 'truncate': truncate, 'cssclass': cssclass,
+         'show_link': show_link, 'title_url': title_url},
+        obj, "reference", truncate, cssclass, show_link, title_url)
 
 
 @stringfilter
@@ -2,9 +2,13 @@ from datetime import datetime, timedelta
 from django.test.testcases import TestCase
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
 from djinn_contenttypes.models.signal_processors import (
     unpublish, publish, created, changed)
+from djinn_contenttypes.models.history import History
 from django.apps import apps
+from unittest import mock
+from djinn_contenttypes import dispatch
 
 class BaseContentTest(TestCase):
 
@@ -18,6 +22,7 @@ class BaseContentTest(TestCase):
             changed_by=self.user,
             title="test news",
             creator=self.user)
+        dispatch.flush()
 
     def test_deleted(self):
 
@@ -27,6 +32,55 @@ class BaseContentTest(TestCase):
 
         self.assertTrue(self.content.is_deleted)
 
+    def test_sender_scoped_signals(self):
+
+        class Other(object):
+
+            pass
+
+        # History gets no more receivers than any model that nobody
+        # listens to specifically
+        #
+        self.assertTrue(post_save.has_listeners(self.content.__class__))
+        self.assertEquals(post_save.has_listeners(Other),
+                          post_save.has_listeners(History))
+
+    def test_visibility(self):
+
+        visibility = self.content.visibility
+        snapshot = self.content.__dict__["_visibility"]
+
+        self.assertTrue(self.content.is_public)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(visibility, self.content.visibility)
+
+        self.content.publish_from = datetime.now() + timedelta(days=1)
+
+        self.assertFalse(self.content.visibility.published)
+
+        self.content.save()
+
+        self.assertFalse(snapshot is self.content.__dict__.get("_visibility"))
+
+        # Published follows the clock, not the snapshot
+        #
+        self.content.publish_from = None
+        self.content.publish_to = datetime.now() + timedelta(minutes=1)
+
+        self.assertTrue(self.content.visibility.published)
+
+        later = mock.Mock(wraps=datetime)
+        later.now.return_value = datetime.now() + timedelta(minutes=2)
+
+        with mock.patch("djinn_contenttypes.models.publishable.datetime",
+                        later), self.assertNumQueries(0):
+            self.assertFalse(self.content.visibility.published)
+
+        self.content.delete()
+
+        self.assertTrue(self.content.visibility.deleted)
+
     def test_viewers(self):
 
         self.assertTrue("group_users" in self.content.viewers)
@@ -48,6 +102,36 @@ class BaseContentTest(TestCase):
 
         self.assertEquals(1, len(self.content.viewers))
 
+    def test_bulk_viewers(self):
+
+        news_model = apps.get_model("djinn_news", "News")
+
+        other = news_model.objects.create(
+            changed_by=self.user,
+            title="other news",
+            creator=self.user,
+            publish_from=datetime.now() + timedelta(days=1))
+
+        self.content.set_owner(self.user)
+
+        viewers = news_model.bulk_viewers(
+            news_model.objects.filter(pk__in=[self.content.pk, other.pk]).
+            order_by("pk"))
+
+        self.assertEquals(sorted(self.content.viewers), sorted(viewers[0]))
+        self.assertEquals(sorted(other.viewers), sorted(viewers[1]))
+        self.assertFalse("group_users" in viewers[1])
+
+    def test_prime_viewers(self):
+
+        viewers = self.content.viewers
+        self.content.__class__.prime_viewers([self.content])
+
+        self.assertTrue("_viewers" in self.content.__dict__)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(sorted(viewers), sorted(self.content.viewers))
+
     def testlifecycle(self):
 
         callbacks = []
@@ -84,6 +168,7 @@ class BaseContentTest(TestCase):
             changed_by=self.user,
             title="test news",
             creator=self.user)
+        dispatch.flush()
 
         self.assertTrue("created" == callbacks[0])
         self.assertTrue("publish_first" == callbacks[1])
@@ -91,6 +176,7 @@ class BaseContentTest(TestCase):
 
         content.publish_from = tomorrow
         content.save()
+        dispatch.flush()
 
         self.assertTrue("changed" == callbacks[-2])
         self.assertTrue("unpublish" == callbacks[-1])
@@ -98,7 +184,18 @@ class BaseContentTest(TestCase):
 
         content.publish_from = None
         content.save()
+        dispatch.flush()
 
         self.assertTrue("changed" == callbacks[-2])
         self.assertTrue("publish" == callbacks[-1])
         self.assertEquals(6, len(callbacks))
+
+        # Within a transaction, intents are coalesced per instance
+        content.publish_from = tomorrow
+        content.save()
+        content.publish_from = None
+        content.save()
+        content.save()
+        dispatch.flush()
+
+        self.assertEquals(["changed"], callbacks[6:])
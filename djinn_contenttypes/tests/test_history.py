@@ -1,8 +1,15 @@
+import gzip
+import os
+import tempfile
+from io import StringIO
+from datetime import datetime, timedelta
 from django.test.testcases import TestCase
+from django.core.management import call_command
 from django.db import models
 from django.contrib.auth import get_user_model
 from djinn_contenttypes.models.history import (
-    History, CHANGED, CREATED, PUBLISHED, UNPUBLISHED)
+    History, PublicationState, CHANGED, CREATED, PUBLISHED, UNPUBLISHED)
+from djinn_contenttypes.models.contenttype import get_ct_id
 from django.apps import apps
 
 
@@ -62,6 +69,45 @@ class HistoryTest(TestCase):
                             self.content,
                             PUBLISHED, UNPUBLISHED).status_flag)
 
+    def test_publication_flag(self):
+
+        self.assertEquals(PUBLISHED,
+                          History.objects.get_publication_flag(self.content))
+
+        History.objects.log(self.content, UNPUBLISHED)
+
+        self.assertEquals(UNPUBLISHED,
+                          History.objects.get_publication_flag(self.content))
+
+        History.objects.log(self.content, CHANGED)
+
+        self.assertEquals(UNPUBLISHED,
+                          History.objects.get_publication_flag(self.content))
+
+        ct_id, pk = get_ct_id(self.content), self.content.pk
+
+        self.content.delete()
+
+        self.assertFalse(PublicationState.objects.filter(
+            object_ct_id=ct_id, object_id=pk).exists())
+
+    def test_buffered(self):
+
+        """ Tests run in a transaction, so nothing is written yet. """
+
+        History.objects.log(self.content, CHANGED)
+        History.objects.log(self.content, CHANGED)
+
+        self.assertEquals(0, History.objects.filter(
+            object_id=self.content.id).count())
+
+        self.assertEquals(CHANGED,
+                          History.objects.get_last(self.content, as_flag=True))
+        self.assertTrue(History.objects.has_been(self.content, CREATED))
+
+        # Pending entries are dated when logged
+        self.assertTrue(History.objects.get_last(self.content).date)
+
     def test_auto_cleanup(self):
 
         History.objects.log(self.content, PUBLISHED)
@@ -69,3 +115,43 @@ class HistoryTest(TestCase):
         self.content.delete()
 
         self.assertEquals(None, History.objects.get_last(self.content))
+
+    def test_archive_keeps_last_marker(self):
+
+        """ Archiving must leave the latest PUBLISHED/UNPUBLISHED entry """
+
+        # Use an object without buffered history
+        other = self.content.__class__(id=self.content.id + 1000)
+        ct_id = get_ct_id(other)
+        now = datetime.now()
+
+        for days, flag in [(800, PUBLISHED), (790, CHANGED),
+                           (780, UNPUBLISHED), (770, CHANGED)]:
+            entry = History.objects.create(
+                object_ct_id=ct_id, object_id=other.id, status_flag=flag)
+            History.objects.filter(pk=entry.pk).update(
+                date=now - timedelta(days=days))
+
+        handle, path = tempfile.mkstemp(suffix=".jsonl.gz")
+        os.close(handle)
+
+        out = StringIO()
+
+        try:
+            call_command("archive_history", path, days=730, stdout=out)
+
+            with gzip.open(path, "rt") as archive:
+                self.assertEquals(3, len(archive.readlines()))
+        finally:
+            os.remove(path)
+
+        self.assertIn("Archived 3 history entries", out.getvalue())
+        self.assertEquals(
+            [UNPUBLISHED],
+            list(History.objects.filter(object_ct_id=ct_id,
+                                        object_id=other.id).values_list(
+                                            "status_flag", flat=True)))
+        self.assertEquals(
+            UNPUBLISHED,
+            History.objects.get_last(other, PUBLISHED,
+                                     UNPUBLISHED).status_flag)
@@ -0,0 +1,180 @@
+from datetime import datetime
+from unittest import mock
+from django.test.testcases import TestCase
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.apps import apps
+from pgcontent.models import Article
+from djinn_contenttypes import dispatch, indexing
+from djinn_contenttypes.models.indexqueue import IndexQueue
+from djinn_contenttypes.models.contenttype import get_ct_id
+
+
+class IndexingTest(TestCase):
+
+    def setUp(self):
+
+        news_model = apps.get_model("djinn_news", "News")
+        user_model = get_user_model()
+
+        self.user = user_model.objects.create(username="bobdobalina")
+        self.news = [news_model.objects.create(
+            changed_by=self.user, title="news %d" % idx, creator=self.user)
+            for idx in range(2)]
+        self.article = Article.objects.create(
+            changed_by=self.user, title="article", creator=self.user)
+        dispatch.flush()
+
+        self.missing = self.news[-1].pk + 1000
+
+        # The cache outlives the test transaction, so open the windows
+        #
+        keys = [indexing._window_key(get_ct_id(obj), obj.pk)
+                for obj in self.news + [self.article]] + \
+            [indexing._window_key(get_ct_id(self.news[0]), self.missing)]
+        cache.delete_many(keys)
+        self.addCleanup(cache.delete_many, keys)
+
+        # Mock haystack: every object is indexed by the same index
+        #
+        self.connection = mock.MagicMock()
+        self.index = \
+            self.connection.get_unified_index.return_value.get_index.\
+            return_value
+        self.index.should_update.return_value = True
+        self.backend = self.connection.get_backend.return_value
+
+        connections = mock.MagicMock()
+        connections.__getitem__.return_value = self.connection
+
+        patcher = mock.patch(
+            "djinn_contenttypes.indexing.haystack_connections", connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queue(self):
+
+        ct_id = get_ct_id(self.article)
+
+        IndexQueue.objects.enqueue(ct_id, self.article.pk)
+        IndexQueue.objects.enqueue(ct_id, self.article.pk)
+
+        self.assertEquals(1, IndexQueue.objects.count())
+
+        entries = IndexQueue.objects.claim()
+
+        self.assertEquals([(ct_id, self.article.pk)],
+                          [(entry.object_ct_id, entry.object_id)
+                           for entry in entries])
+
+        IndexQueue.objects.done(entries)
+
+        self.assertFalse(IndexQueue.objects.exists())
+
+    def test_process(self):
+
+        news_ct = get_ct_id(self.news[0])
+        missing = self.missing
+
+        for obj in self.news + [self.article]:
+            indexing.enqueue(get_ct_id(obj), obj.pk)
+        indexing.enqueue(news_ct, missing)
+
+        self.assertEquals(4, indexing.process())
+        self.assertFalse(IndexQueue.objects.exists())
+
+        # One update per type
+        #
+        self.assertEquals(2, self.backend.update.call_count)
+        updated = sorted(
+            sorted((obj.__class__.__name__, obj.pk) for obj in call[0][1])
+            for call in self.backend.update.call_args_list)
+
+        self.assertEquals(
+            [[("Article", self.article.pk)],
+             [("News", obj.pk) for obj in self.news]], updated)
+
+        # The missing object is removed from the index
+        #
+        self.backend.remove.assert_called_once_with(
+            "djinn_news.news.%s" % missing)
+
+    def test_process_failure(self):
+
+        bad = self.news[0]
+
+        def update(index, objects):
+
+            if bad in objects:
+                raise ValueError("bad object")
+
+        self.backend.update.side_effect = update
+
+        for obj in self.news + [self.article]:
+            indexing.enqueue(get_ct_id(obj), obj.pk)
+
+        self.assertEquals(3, indexing.process())
+
+        # Only the bad object stays, to be tried again later
+        #
+        entry = IndexQueue.objects.get()
+
+        self.assertEquals(bad.pk, entry.object_id)
+        self.assertEquals(1, entry.attempts)
+        self.assertTrue("bad object" in entry.last_error)
+        self.assertTrue(entry.next_attempt > datetime.now())
+
+        self.assertEquals(0, indexing.process())
+
+        # After max_attempts, the entry is parked
+        #
+        IndexQueue.objects.update(next_attempt=datetime.now())
+
+        self.assertEquals(1, indexing.process(max_attempts=2))
+
+        IndexQueue.objects.update(next_attempt=datetime.now())
+
+        self.assertEquals(0, indexing.process(max_attempts=2))
+        self.assertEquals(2, IndexQueue.objects.get().attempts)
+
+        # Until the object is queued again
+        #
+        IndexQueue.objects.enqueue(get_ct_id(bad), bad.pk)
+
+        self.assertEquals(0, IndexQueue.objects.get().attempts)
+
+    def test_enqueue_window(self):
+
+        ct_id = get_ct_id(self.article)
+
+        indexing.enqueue(ct_id, self.article.pk)
+
+        self.assertEquals(1, IndexQueue.objects.count())
+
+        # Within the window, the database is left alone
+        #
+        IndexQueue.objects.all().delete()
+        indexing.enqueue(ct_id, self.article.pk)
+
+        self.assertFalse(IndexQueue.objects.exists())
+
+        # Processing the queue closes the window
+        #
+        IndexQueue.objects.enqueue(ct_id, self.article.pk)
+        indexing.process()
+        indexing.enqueue(ct_id, self.article.pk)
+
+        self.assertEquals(1, IndexQueue.objects.count())
+
+    def test_schedule_index(self):
+
+        with mock.patch.object(indexing, "DEFERRED_SEARCH_INDEXING", True), \
+                mock.patch("django.db.transaction.on_commit",
+                           side_effect=lambda func, using=None: func()):
+
+            indexing.schedule_index(self.article)
+            indexing.schedule_index(self.article)
+
+        self.assertEquals(
+            [(get_ct_id(self.article), self.article.pk)],
+            list(IndexQueue.objects.values_list("object_ct_id", "object_id")))
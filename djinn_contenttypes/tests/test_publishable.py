@@ -1,9 +1,20 @@
 from datetime import datetime, timedelta
 from django.test.testcases import TestCase
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from djinn_contenttypes.models.signal_processors import unpublish, publish
 from django.apps import apps
+from djinn_contenttypes import dispatch
+from djinn_contenttypes.models.signalqueue import QueuedSignal
+from djinn_contenttypes.models.history import (
+    History, PUBLISHED, UNPUBLISHED)
+from djinn_contenttypes.publishing import (
+    due_for_publish, due_for_unpublish, process_batched, publish_chunk,
+    unpublish_chunk)
+from django.core.management import call_command
+from io import StringIO
+import json
+from unittest import mock
 
 class PublishableTest(TestCase):
 
@@ -17,6 +28,7 @@ class PublishableTest(TestCase):
             changed_by=self.user,
             title="test news",
             creator=self.user)
+        dispatch.flush()
 
     def test_is_public(self):
 
@@ -85,6 +97,7 @@ class PublishableTest(TestCase):
         self.content.publish_notified = True
         self.content.publish_from = tomorrow
         self.content.save()
+        dispatch.flush()
 
         self.assertFalse(self.content.publish_notified)
 
@@ -104,11 +117,13 @@ class PublishableTest(TestCase):
 
         self.content.publish_from = tomorrow
         self.content.save()
+        dispatch.flush()
 
         self.assertFalse(self.content.is_published)
 
         self.content.publish_from = datetime.now()
         self.content.save()
+        dispatch.flush()
 
         self.assertTrue(self.content.is_published)
         self.assertTrue(len(signalled) == 1 and signalled[0] == "published")
@@ -116,11 +131,13 @@ class PublishableTest(TestCase):
         self.content.publish_from = yesterday
         self.content.publish_to = yesterday
         self.content.save()
+        dispatch.flush()
 
         self.assertFalse(self.content.is_published)
 
         self.content.publish_to = None
         self.content.save()
+        dispatch.flush()
 
         self.assertTrue(self.content.is_published)
         self.assertTrue(len(signalled) == 2 and signalled[1] == "published")
@@ -133,12 +150,14 @@ class PublishableTest(TestCase):
         self.content.publish_to = yesterday
 
         self.content.save()
+        dispatch.flush()
 
         self.assertFalse(self.content.is_deleted)
 
         self.content.publish_to = tomorrow
 
         self.content.save()
+        dispatch.flush()
 
         self.assertFalse(self.content.is_deleted)
 
@@ -146,5 +165,241 @@ class PublishableTest(TestCase):
         self.content.remove_after_publish_to = True
 
         self.content.save()
+        dispatch.flush()
 
         self.assertTrue(self.content.is_deleted)
+
+    def test_cancelled_publish_keeps_first_edition(self):
+
+        signalled = []
+
+        def publish_callback(sender, instance, **kwargs):
+
+            signalled.append(("publish", kwargs.get("first_edition")))
+
+        def unpublish_callback(sender, instance, **kwargs):
+
+            signalled.append(("unpublish", None))
+
+        publish.connect(publish_callback)
+        unpublish.connect(unpublish_callback)
+
+        sender = self.content.__class__
+
+        dispatch.send(publish, sender, self.content, first_edition=True)
+        dispatch.send(unpublish, sender, self.content)
+        dispatch.flush()
+
+        self.assertEquals([], signalled)
+
+        dispatch.send(publish, sender, self.content, first_edition=True)
+        dispatch.send(unpublish, sender, self.content)
+        dispatch.send(publish, sender, self.content)
+        dispatch.flush()
+
+        self.assertEquals([("publish", True)], signalled)
+
+    def test_nested_transaction(self):
+
+        signalled = []
+
+        def publish_callback(sender, instance, **kwargs):
+
+            signalled.append(kwargs.get("first_edition"))
+
+        publish.connect(publish_callback)
+
+        sender = self.content.__class__
+
+        # One buffer for the outermost transaction
+        #
+        dispatch.send(publish, sender, self.content, first_edition=True)
+
+        with transaction.atomic():
+            dispatch.send(publish, sender, self.content)
+
+        dispatch.flush()
+
+        self.assertEquals([True], signalled)
+
+        # What a rolled back savepoint did is undone
+        #
+        dispatch.send(publish, sender, self.content)
+
+        try:
+            with transaction.atomic():
+                dispatch.send(unpublish, sender, self.content)
+                raise ValueError()
+        except ValueError:
+            pass
+
+        dispatch.flush()
+
+        self.assertEquals([True, None], signalled)
+
+    def test_signal_queue(self):
+
+        signalled = []
+
+        def publish_callback(sender, instance, **kwargs):
+
+            signalled.append((instance, kwargs.get("first_edition")))
+
+        publish.connect(publish_callback)
+
+        QueuedSignal.objects.enqueue("publish", self.content,
+                                     {"first_edition": True})
+
+        self.assertEquals((1, 0), QueuedSignal.objects.process())
+        self.assertEquals([(self.content, True)], signalled)
+        self.assertFalse(QueuedSignal.objects.exists())
+
+    def test_signal_outbox(self):
+
+        signalled = []
+
+        def publish_callback(sender, instance, **kwargs):
+
+            signalled.append(instance)
+
+        publish.connect(publish_callback)
+
+        sender = self.content.__class__
+
+        with mock.patch("djinn_contenttypes.dispatch.ASYNC_CONTENT_SIGNALS",
+                        True):
+
+            # The row is written within the transaction, and kept in sync
+            # with the intents of the transaction
+            #
+            dispatch.send(publish, sender, self.content, first_edition=True)
+
+            self.assertEquals(
+                ["publish"],
+                list(QueuedSignal.objects.values_list("signal", flat=True)))
+
+            dispatch.send(unpublish, sender, self.content)
+
+            self.assertFalse(QueuedSignal.objects.exists())
+
+            dispatch.send(publish, sender, self.content)
+            dispatch.flush()
+
+        self.assertEquals([], signalled)
+
+        event = QueuedSignal.objects.get()
+
+        self.assertEquals("publish", event.signal)
+        self.assertEquals({"first_edition": True}, json.loads(event.kwargs))
+
+        self.assertEquals((1, 0), QueuedSignal.objects.process())
+        self.assertEquals([self.content], signalled)
+
+    def _due(self, **kwargs):
+
+        """ Create content that is due for publishing """
+
+        content = self.content.__class__.objects.create(
+            changed_by=self.user,
+            title="due news",
+            creator=self.user,
+            publish_from=datetime.now() + timedelta(days=1),
+            **kwargs)
+        dispatch.flush()
+
+        content.__class__.objects.filter(pk=content.pk).update(
+            publish_from=datetime.now() - timedelta(days=1))
+
+        return content.__class__.objects.get(pk=content.pk)
+
+    def test_publish_chunk(self):
+
+        signalled = []
+
+        def publish_callback(sender, instance, **kwargs):
+
+            signalled.append((instance.pk, kwargs.get("first_edition")))
+
+        publish.connect(publish_callback)
+
+        content = self._due()
+        tmp = self._due(is_tmp=True)
+        model = content.__class__
+
+        self.assertEquals(
+            (2, 1), process_batched(due_for_publish(model), publish_chunk, 1))
+        dispatch.flush()
+
+        self.assertEquals([(content.pk, True)], signalled)
+        self.assertEquals(
+            PUBLISHED,
+            History.objects.get_last(content, PUBLISHED, UNPUBLISHED)
+            .status_flag)
+        self.assertEquals(
+            None, History.objects.get_last(tmp, PUBLISHED, UNPUBLISHED))
+        self.assertTrue(model.objects.get(pk=content.pk).publish_notified)
+        self.assertFalse(model.objects.get(pk=tmp.pk).publish_notified)
+        self.assertFalse(due_for_publish(model).filter(
+            pk=content.pk).exists())
+
+    def test_publish_chunk_skips(self):
+
+        private = self._due()
+        deleted = self._due()
+        model = private.__class__
+
+        # Pretend the workflow state is private
+        private._set_visibility("private", False)
+
+        model.objects.filter(pk=deleted.pk).delete()
+
+        self.assertEquals(0, publish_chunk(model, [private, deleted]))
+        self.assertFalse(model.objects.get(pk=private.pk).publish_notified)
+        self.assertEquals(
+            None, History.objects.get_last(private, PUBLISHED, UNPUBLISHED))
+
+    def test_unpublish_chunk(self):
+
+        signalled = []
+
+        def unpublish_callback(sender, instance, **kwargs):
+
+            signalled.append(instance.pk)
+
+        unpublish.connect(unpublish_callback)
+
+        model = self.content.__class__
+        model.objects.filter(pk=self.content.pk).update(
+            publish_to=datetime.now() - timedelta(days=1))
+
+        self.assertEquals(
+            (1, 1),
+            process_batched(due_for_unpublish(model), unpublish_chunk, 10))
+
+        # Signals go out when the chunk commits
+        self.assertEquals([], signalled)
+
+        dispatch.flush()
+
+        self.assertEquals([self.content.pk], signalled)
+        self.assertEquals(
+            UNPUBLISHED,
+            History.objects.get_last(self.content, PUBLISHED, UNPUBLISHED)
+            .status_flag)
+
+        content = model.objects.get(pk=self.content.pk)
+
+        self.assertTrue(content.unpublish_notified)
+        self.assertFalse(content.publish_notified)
+
+    def test_publish_dry_run(self):
+
+        content = self._due()
+        out = StringIO()
+
+        call_command("publish", dry_run=True, stdout=out)
+
+        self.assertIn("%s: 1 due, 0 published" % content.__class__.__name__,
+                      out.getvalue())
+        self.assertFalse(content.__class__.objects.get(
+            pk=content.pk).publish_notified)
@@ -0,0 +1,66 @@
+from django.test.testcases import TestCase
+from djinn_contenttypes.registry import CTRegistry
+
+
+class Base(object):
+
+    pass
+
+
+class Foo(Base):
+
+    pass
+
+
+class Bar(object):
+
+    pass
+
+
+class RegistryTest(TestCase):
+
+    def setUp(self):
+
+        self.content_types = dict(CTRegistry.content_types)
+
+        CTRegistry.register("foo", {"class": Foo, "app": "testapp",
+                                    "global_add": True})
+        CTRegistry.register("bar", {"class": Bar, "app": "testapp"})
+        CTRegistry.freeze()
+
+    def tearDown(self):
+
+        CTRegistry.content_types = self.content_types
+        CTRegistry.freeze()
+
+    def test_lookups(self):
+
+        self.assertEquals("testapp.foo", CTRegistry.get_name_by_class(Foo))
+        self.assertEquals("testapp", CTRegistry.get_by_class(Bar)["app"])
+        self.assertEquals({}, CTRegistry.get_by_class(Base))
+        self.assertEquals(("testapp.bar", "testapp.foo"),
+                          CTRegistry.list_by_app("testapp"))
+        self.assertEquals((), CTRegistry.list_by_app("nosuchapp"))
+        self.assertIn("testapp.foo", CTRegistry.list_by_flag("global_add"))
+        self.assertNotIn("testapp.bar",
+                         CTRegistry.list_by_flag("global_add"))
+        self.assertEquals(("testapp.foo",), CTRegistry.list_by_base(Base))
+
+    def test_register_after_freeze(self):
+
+        # Fill the lazy indexes first
+        self.assertEquals(("testapp.foo",), CTRegistry.list_by_base(Base))
+
+        class Baz(Base):
+
+            pass
+
+        CTRegistry.register("baz", {"class": Baz, "app": "testapp",
+                                    "global_add": True})
+
+        self.assertEquals("testapp.baz", CTRegistry.get_name_by_class(Baz))
+        self.assertEquals(("testapp.baz", "testapp.foo"),
+                          CTRegistry.list_by_base(Base))
+        self.assertIn("testapp.baz", CTRegistry.list_by_flag("global_add"))
+        self.assertIn("testapp.baz", CTRegistry.list_by_app("testapp"))
+        self.assertIn("testapp.baz", CTRegistry.list_types())
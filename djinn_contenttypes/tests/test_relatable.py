@@ -1,6 +1,9 @@
 from django.test.testcases import TestCase
-from djinn_contenttypes.models.relatable import RelatableMixin
+from djinn_contenttypes.models.relatable import (
+    RelatableMixin, prefetch_relations, bulk_rm_all_relations)
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from io import StringIO
 
 
 class FakeContent(RelatableMixin):
@@ -49,3 +52,133 @@ class RelatableTest(TestCase):
         self.assertTrue(self.target.has_relation(RELATION, inverse=True))
         self.assertTrue(self.target.has_relation(RELATION, inverse=True,
                                                  target=self.source))
+
+    def test_add_rm_relations(self):
+
+        other = FakeContent(3)
+
+        self.source.add_relation(RELATION, self.target)
+
+        created = self.source.add_relations(RELATION, [self.target, other])
+
+        self.assertEquals(1, len(created))
+        self.assertTrue(self.source.has_relation(RELATION, other))
+
+        self.source.rm_relations(RELATION, [self.target, other])
+
+        self.assertFalse(self.source.has_relation(RELATION))
+
+        self.source.add_relations(RELATION, [self.target])
+        self.target.add_relations(RELATION, [other])
+
+        self.target.rm_all_relations()
+
+        self.assertFalse(self.source.has_relation(RELATION))
+        self.assertFalse(self.target.has_relation(RELATION))
+
+    def test_related_graph(self):
+
+        other = FakeContent(3)
+
+        self.source.add_relation(RELATION, self.target)
+        self.target.add_relation(RELATION, other)
+        other.add_relation(RELATION, self.source)
+
+        ct_id = self.source.ct_class.id
+
+        graph = self.source.get_related_graph(depth=1)
+
+        self.assertEquals({(ct_id, 1): 0, (ct_id, 2): 1}, graph.nodes)
+        self.assertEquals(1, len(graph.edges))
+
+        graph = self.source.get_related_graph(depth=3)
+
+        self.assertEquals({(ct_id, 1): 0, (ct_id, 2): 1, (ct_id, 3): 2},
+                          graph.nodes)
+
+        # The cycle back to the source shows in the edges
+        #
+        self.assertTrue(((ct_id, 3), (ct_id, 1), RELATION, 3) in graph.edges)
+
+        # Going around the cycle again doesn't add edges
+        #
+        self.assertEquals(3, len(graph.edges))
+        self.assertEquals(
+            3, len(self.source.get_related_graph(depth=6).edges))
+
+    def test_related_graph_dense(self):
+
+        nodes = [self.source, self.target] + [
+            FakeContent(_id) for _id in range(3, 7)]
+
+        for src in nodes:
+            for tgt in nodes:
+                if src is not tgt:
+                    src.add_relation(RELATION, tgt)
+
+        graph = self.source.get_related_graph(depth=4)
+
+        # Every node is one hop away, and every edge is followed once
+        #
+        self.assertEquals(
+            [0, 1, 1, 1, 1, 1],
+            sorted(graph.nodes.values()))
+        self.assertEquals(30, len(graph.edges))
+
+    def test_prefetch_relations(self):
+
+        self.source.add_relation(RELATION, self.target)
+
+        prefetch_relations([self.source, self.target])
+
+        # Served from memory now
+        #
+        with self.assertNumQueries(0):
+            related = self.source.get_related(RELATION)
+            self.assertEquals([], self.target.get_related())
+
+        self.assertEquals([2], [obj.id for obj in related])
+
+    def test_bulk_rm_all_relations(self):
+
+        other = FakeContent(3)
+        unrelated = FakeContent(4)
+
+        self.source.add_relation(RELATION, self.target)
+        other.add_relation(RELATION, self.source)
+        unrelated.add_relation(RELATION, other)
+
+        bulk_rm_all_relations([self.source, self.target])
+
+        self.assertFalse(self.source.has_relation(RELATION))
+        self.assertFalse(other.has_relation(RELATION))
+        self.assertTrue(unrelated.has_relation(RELATION, other))
+
+    def test_sweep_relations(self):
+
+        # Our fake content is content types, so this one exists...
+        #
+        present = FakeContent(
+            ContentType.objects.get_for_model(ContentType).id)
+        gone = FakeContent(999999)
+        also_gone = FakeContent(999998)
+
+        present.add_relation(RELATION, gone)
+        gone.add_relation(RELATION, present)
+        gone.add_relation(RELATION, also_gone)
+        present.add_relation(RELATION, present)
+
+        relation_model = present.relation_model
+
+        out = StringIO()
+        call_command("sweep_relations", dry_run=True, stdout=out)
+
+        self.assertIn("3 broken relations found", out.getvalue())
+        self.assertEquals(4, relation_model.objects.count())
+
+        out = StringIO()
+        call_command("sweep_relations", stdout=out)
+
+        self.assertIn("3 broken relations removed", out.getvalue())
+        self.assertTrue(present.has_relation(RELATION, present))
+        self.assertEquals(1, relation_model.objects.count())
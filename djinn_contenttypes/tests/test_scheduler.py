@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from django.test.testcases import TestCase
+from django.contrib.auth import get_user_model
+from django.apps import apps
+from django.core.cache import cache
+from djinn_contenttypes.scheduler import (
+    PublishScheduler, PUBLISH, UNPUBLISH, SCHEDULE_CHANGE_KEY,
+    schedule_changed)
+
+
+class PublishSchedulerTest(TestCase):
+
+    def setUp(self):
+
+        self.news_model = apps.get_model("djinn_news", "News")
+        user_model = get_user_model()
+
+        self.user = user_model.objects.create(username="bobdobalina")
+
+    def test_push_pop_due(self):
+
+        now = datetime.now()
+        model = self.news_model
+        scheduler = PublishScheduler()
+
+        scheduler.push(now - timedelta(minutes=1), PUBLISH, model, 1)
+        scheduler.push(now + timedelta(hours=1), PUBLISH, model, 2)
+        scheduler.push(now - timedelta(minutes=2), UNPUBLISH, model, 1)
+
+        # Rescheduled to later, so the first entry is skipped
+        scheduler.push(now - timedelta(minutes=1), PUBLISH, model, 3)
+        scheduler.push(now + timedelta(hours=1), PUBLISH, model, 3)
+
+        self.assertEquals({(model, PUBLISH): [1], (model, UNPUBLISH): [1]},
+                          scheduler.pop_due(now))
+        self.assertEquals({}, scheduler.pop_due(now))
+        self.assertEquals({(model, PUBLISH): [2, 3]},
+                          scheduler.pop_due(now + timedelta(hours=2)))
+        self.assertEquals([], scheduler.queue)
+
+    def test_load_changes(self):
+
+        tomorrow = datetime.now() + timedelta(days=1)
+
+        content = self.news_model.objects.create(
+            changed_by=self.user,
+            title="test news",
+            creator=self.user,
+            publish_from=tomorrow)
+
+        scheduler = PublishScheduler()
+        scheduler.load()
+
+        self.assertEquals(
+            tomorrow,
+            scheduler.scheduled[(self.news_model, content.pk, PUBLISH)])
+
+        # Only the changes given are loaded
+        scheduler = PublishScheduler()
+        scheduler.load({self.news_model: {content.pk + 1000}})
+
+        self.assertFalse((self.news_model, content.pk, PUBLISH) in
+                         scheduler.scheduled)
+
+        scheduler.load({self.news_model: {content.pk}})
+
+        self.assertTrue((self.news_model, content.pk, PUBLISH) in
+                        scheduler.scheduled)
+
+    def test_changes(self):
+
+        scheduler = PublishScheduler()
+
+        # Nothing to go on yet
+        self.assertEquals(None, scheduler.changes())
+        self.assertEquals({}, scheduler.changes())
+
+        content = self.news_model.objects.create(
+            changed_by=self.user,
+            title="test news",
+            creator=self.user,
+            publish_from=datetime.now() + timedelta(days=1))
+
+        schedule_changed(content)
+
+        self.assertEquals({self.news_model: {content.pk}},
+                          scheduler.changes())
+        self.assertEquals({}, scheduler.changes())
+
+        # A lost change means reloading everything
+        schedule_changed(content)
+        cache.delete(SCHEDULE_CHANGE_KEY % (scheduler.seq + 1))
+
+        self.assertEquals(None, scheduler.changes())
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from django.test.testcases import TestCase
+from django.test.client import RequestFactory
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.apps import apps
+from djinn_contenttypes import dispatch
+from djinn_contenttypes.views.base import ConditionalGetMixin
+
+
+class ConditionalView(ConditionalGetMixin):
+
+    def __init__(self, request, obj):
+
+        self.request = request
+        self.object = obj
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+
+        news_model = apps.get_model("djinn_news", "News")
+        user_model = get_user_model()
+
+        self.user = user_model.objects.create(username="bobdobalina",
+                                              is_superuser=True)
+        self.content = news_model.objects.create(
+            changed_by=self.user,
+            title="test news",
+            creator=self.user)
+        dispatch.flush()
+
+        self.factory = RequestFactory()
+
+    def _request(self, etag=None, user=None):
+
+        headers = {}
+
+        if etag:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+
+        request = self.factory.get("/", **headers)
+        request.user = user or self.user
+
+        return request
+
+    def test_not_modified(self):
+
+        view = ConditionalView(self._request(), self.content)
+
+        self.assertEquals(None, view.not_modified())
+
+        etag = view._etag
+
+        view = ConditionalView(self._request(etag), self.content)
+        response = view.not_modified()
+
+        self.assertEquals(304, response.status_code)
+        self.assertEquals(etag, response["ETag"])
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_if_modified_since(self):
+
+        request = self.factory.get(
+            "/", HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        request.user = self.user
+
+        view = ConditionalView(request, self.content)
+
+        # Dates are no good to tell whether we changed
+        self.assertEquals(None, view.not_modified())
+
+    def test_modified(self):
+
+        view = ConditionalView(self._request(), self.content)
+        view.not_modified()
+        etag = view._etag
+
+        # Changed content gives a new ETag
+        #
+        self.content.changed = self.content.changed + timedelta(seconds=1)
+
+        view = ConditionalView(self._request(etag), self.content)
+
+        self.assertEquals(None, view.not_modified())
+        self.assertNotEquals(etag, view._etag)
+
+        etag = view._etag
+
+        # And so does a change of workflow state
+        #
+        self.content._set_visibility("private", False)
+
+        view = ConditionalView(self._request(etag), self.content)
+
+        self.assertEquals(None, view.not_modified())
+        self.assertNotEquals(etag, view._etag)
+
+    def test_etag_per_permission_class(self):
+
+        view = ConditionalView(self._request(), self.content)
+
+        self.assertEquals(view.get_etag("text/html"),
+                          view.get_etag("text/html"))
+        self.assertNotEquals(view.get_etag("text/html"),
+                             view.get_etag("application/json"))
+
+        anonymous = ConditionalView(
+            self._request(user=AnonymousUser()), self.content)
+
+        self.assertNotEquals(view.get_etag("text/html"),
+                             anonymous.get_etag("text/html"))
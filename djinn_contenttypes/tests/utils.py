@@ -2,6 +2,12 @@ from django.test.testcases import TestCase
 from django.contrib.auth.models import User
 from pgcontent.models import Article
 from djinn_core.utils import object_to_urn, urn_to_object
+import json
+from djinn_contenttypes.utils import get_objects_by_ctype_ids
+from djinn_contenttypes import serializers
+from djinn_contenttypes.profiling import percentile
+from djinn_contenttypes.fragments import fragment_key, invalidate_fragments
+from django.template import Context, Template
 
 
 class UtilsTest(TestCase):
@@ -27,3 +33,76 @@ class UtilsTest(TestCase):
         self.assertEquals(
             self.obj,
             urn_to_object("urn:pu.in:pgcontent:article:%s" % self.obj.id))
+
+    def test_get_objects_by_ctype_ids(self):
+
+        self.assertEquals(
+            [self.obj, None, self.obj],
+            get_objects_by_ctype_ids([
+                "urn:pu.in:pgcontent:article:%s" % self.obj.id,
+                "urn:pu.in:pgcontent:article:0",
+                ("article", self.obj.id)]))
+
+    def test_get_objects_by_ctype_ids_malformed(self):
+
+        self.assertEquals(
+            [None, None, None, self.obj],
+            get_objects_by_ctype_ids([
+                "urn:pu.in:pgcontent",
+                "urn:pu.in:pgcontent:article",
+                "urn:pu.in:pgcontent:article:abc",
+                "urn:pu.in:pgcontent:article:%s" % self.obj.id]))
+
+    def test_serialize(self):
+
+        data = serializers.serialize(self.obj, fields=["title", "creator"])
+
+        self.assertEquals({"title": "Article 1", "creator": self.user.id},
+                          data)
+
+        data = json.loads("".join(serializers.stream(
+            {"object_list": Article.objects.filter(pk=self.obj.pk),
+             "is_paginated": False},
+            fields=["title"])))
+
+        self.assertEquals({"is_paginated": False,
+                           "object_list": [{"title": "Article 1"}]}, data)
+
+    def test_fragment_key(self):
+
+        key = fragment_key(self.obj, "title", 10)
+
+        self.assertEquals(key, fragment_key(self.obj, "title", 10))
+        self.assertNotEquals(key, fragment_key(self.obj, "title", 20))
+
+        invalidate_fragments(self.obj)
+
+        self.assertNotEquals(key, fragment_key(self.obj, "title", 10))
+
+    def test_title_tag(self):
+
+        template = Template("{% load djinn_contenttypes %}{% title obj 5 %}")
+
+        self.assertEquals("Artic...",
+                          template.render(Context({"obj": self.obj})).strip())
+
+        # The cached fragment is used until it's invalidated
+        #
+        self.obj.title = "Other"
+
+        self.assertEquals("Artic...",
+                          template.render(Context({"obj": self.obj})).strip())
+
+        invalidate_fragments(self.obj)
+
+        self.assertEquals("Other",
+                          template.render(Context({"obj": self.obj})).strip())
+
+    def test_percentile(self):
+
+        values = list(range(1, 101))
+
+        self.assertEquals(50, percentile(values, 50))
+        self.assertEquals(99, percentile(values, 99))
+        self.assertEquals(1, percentile([1], 90))
+        self.assertEquals(None, percentile([], 90))
@@ -1,3 +1,4 @@
+import threading
 import requests
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -7,6 +8,7 @@ from django.apps import apps
 from django.core import exceptions
 from djinn_core.utils import implements
 from djinn_contenttypes.registry import CTRegistry
+from djinn_contenttypes import identitymap
 
 
 def has_permission(perm, user, obj):
@@ -22,6 +24,34 @@ def has_permission(perm, user, obj):
     return user.has_perm(perm, obj=authority)
 
 
+def permission_class(user, obj):
+
+    """ Return a short fingerprint of what the user may do with obj, so
+    output that only depends on these permissions can be shared between
+    users: 'anonymous', 'superuser', or the permissions held of
+    view, edit and delete, like 'view-edit'. """
+
+    if not user.is_authenticated:
+        return "anonymous"
+
+    if user.is_superuser:
+        return "superuser"
+
+    ct_name = getattr(obj, "ct_name", get_model_name(obj))
+    ct_settings = CTRegistry.get(ct_name)
+
+    perms = [
+        ("view", ct_settings.get("view_permission", "contenttypes.view")),
+        ("edit", ct_settings.get("edit_permission",
+                                 "contenttypes.change_contenttype")),
+        ("delete", ct_settings.get("delete_permission",
+                                   "contenttypes.delete_contenttype"))]
+
+    return "-".join(
+        name for (name, perm) in perms if has_permission(perm, user, obj)
+    ) or "none"
+
+
 def get_model_name(model):
 
     "Returns the Python model class for this type of content."
@@ -31,20 +61,42 @@ def get_model_name(model):
     return str(model)
 
 
+_seed_lock = threading.Lock()
+_seeded = False
+
+
+def get_contenttype(app_label, model_name):
+
+    """ Get content type by app label and model name, from Django's
+    content type cache. On first use, the cache is seeded with the
+    content types of all registered types in one query. """
+
+    global _seeded
+
+    if not _seeded:
+        with _seed_lock:
+            if not _seeded:
+                ContentType.objects.get_for_models(*set(
+                    CTRegistry.get_attr(name, 'class') for name in
+                    CTRegistry.list_types()
+                    if CTRegistry.get_attr(name, 'class') is not None))
+                _seeded = True
+
+    return ContentType.objects.get_by_natural_key(app_label, model_name)
+
+
 def get_contenttype_by_ct_name(ct_name, app_label=None):
     if app_label is None:
         app_label = CTRegistry.get(ct_name)['app']
 
-    return ContentType.objects.get(app_label=app_label,
-                                   model=ct_name)
+    return get_contenttype(app_label, ct_name)
 
 
 def get_contenttype_by_ctype(ctype, app_label=None):
     if app_label is None:
         app_label = CTRegistry.get(get_model_name(ctype))['app']
 
-    return ContentType.objects.get(app_label=app_label,
-                                   model=get_model_name(ctype))
+    return get_contenttype(app_label, get_model_name(ctype))
 
 
 def get_object_by_ctype(ctype, _id, app_label=None):
@@ -58,22 +110,86 @@ def get_object_by_ctype_id(ctype_id, _id, app_label=None):
 
     ctype = CTRegistry.get(ctype_id)['class']
 
-    return get_object_by_ctype(ctype, _id, app_label)
+    obj = identitymap.get(ctype, _id)
 
+    if obj is None:
+        obj = identitymap.add(get_object_by_ctype(ctype, _id, app_label))
 
-def json_serializer(obj):
+    return obj
 
-    if implements(obj, Model):
 
-        obj_data = {}
+def get_objects_by_ctype_ids(keys):
+
+    """ Batch version of get_object_by_ctype_id. Keys are (ctype, id)
+    pairs, where ctype is a name as registered with the CTRegistry, or
+    URNs. Objects are fetched with one query per type, using the
+    'select_related' and 'prefetch_related' attributes of the registered
+    type if set. Returns a list in the order of the keys, with None for
+    objects that could not be found, or whose key is malformed. """
+
+    models = []
 
-        for field in obj._meta.fields:
+    for key in keys:
+
+        if isinstance(key, str):
+            parts = key.split(":")
+            try:
+                model = get_contenttype(parts[2], parts[3]).model_class()
+                _id = parts[4]
+            except (IndexError, ContentType.DoesNotExist):
+                model, _id = None, None
+        else:
+            ctype, _id = key
+            model = CTRegistry.get(ctype).get('class')
+
+        if model is not None:
             try:
-                obj_data[field.name] = str(field.value_from_object(obj))
-            except:
-                pass
+                _id = model._meta.pk.to_python(_id)
+            except exceptions.ValidationError:
+                model, _id = None, None
+
+        models.append((model, _id))
+
+    by_model = {}
+    objects = {}
+
+    for model, _id in models:
+        if model is None:
+            continue
+
+        obj = identitymap.get(model, _id)
+
+        if obj is None:
+            by_model.setdefault(model, set()).add(_id)
+        else:
+            objects.setdefault(model, {})[_id] = obj
+
+    for model, ids in by_model.items():
+
+        qs = model._default_manager.all()
+        details = CTRegistry.get_by_class(model)
+
+        if details.get('select_related'):
+            qs = qs.select_related(*details['select_related'])
+        if details.get('prefetch_related'):
+            qs = qs.prefetch_related(*details['prefetch_related'])
+
+        for _id, obj in qs.in_bulk(list(ids)).items():
+            objects.setdefault(model, {})[_id] = identitymap.add(obj)
+
+    return [objects.get(model, {}).get(_id) for (model, _id) in models]
+
+
+def json_serializer(obj):
+
+    """ Use as default for json.dumps. Models are serialized as a dict,
+    see djinn_contenttypes.serializers """
+
+    from djinn_contenttypes.serializers import serialize
+
+    if implements(obj, Model):
 
-        return str(obj_data)
+        return serialize(obj)
 
     return "NOT SERIALIZABLE"
 
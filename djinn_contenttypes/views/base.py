@@ -5,25 +5,36 @@ from django.views.generic.edit import DeleteView as BaseDeleteView
 from django.views.generic.edit import CreateView as BaseCreateView
 from django.views.generic.base import TemplateResponseMixin
 from django.http import HttpResponseRedirect, HttpResponse, \
-    HttpResponseForbidden
+    HttpResponseForbidden, StreamingHttpResponse
 from django.apps import apps
 from django.urls import reverse
 from django.contrib import messages
 from django.utils.translation import ugettext_lazy as _
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.decorators import method_decorator
+from django.db import transaction
+import hashlib
 import json
 
 from djinn_contenttypes.settings import WYSIWYG_SIZE_NAMES, \
-    IMAGESIZES_CHECKING_INTERVAL_SECS
+    IMAGESIZES_CHECKING_INTERVAL_SECS, PROFILE_SIGNALS, PROFILE_SERVER_TIMING
 from djinn_core.utils import implements
 from djinn_contenttypes.registry import CTRegistry
 from djinn_contenttypes.utils import (
-    get_object_by_ctype_id, has_permission, check_get_url)
+    get_object_by_ctype_id, has_permission, check_get_url, permission_class)
 from djinn_contenttypes.models.base import BaseContent, LocalRoleMixin
-from djinn_contenttypes.utils import json_serializer
+from djinn_contenttypes import serializers, profiling
+from djinn_contenttypes.fragments import (
+    fragment_key, get_fragment, set_fragment)
 from djinn_workflow.utils import get_state
 from pgauth.models import UserGroup
 from django.core.exceptions import ImproperlyConfigured
-from djinn_search.utils import update_index_for_instance
+from djinn_contenttypes.indexing import schedule_index
+
+
+SERVER_TIMING = PROFILE_SIGNALS and PROFILE_SERVER_TIMING
 
 
 def forbidden_page(request):
@@ -199,6 +210,15 @@ class AcceptMixin(object):
 
         return "text/plain" in self.request.META.get("HTTP_ACCEPT", [])
 
+    @property
+    def json_fields(self):
+
+        """ Fields requested for JSON output, as ?fields=title,changed """
+
+        fields = self.request.GET.get("fields")
+
+        return fields and fields.split(",") or None
+
     def render_to_response(self, context, **response_kwargs):
 
         if self.is_json:
@@ -210,9 +230,13 @@ class AcceptMixin(object):
 
             response_kwargs["content_type"] = 'application/json'
 
+            if "object_list" in context:
+                return StreamingHttpResponse(
+                    serializers.stream(context, fields=self.json_fields),
+                    **response_kwargs)
+
             return HttpResponse(
-                json.dumps(context, skipkeys=True,
-                           default=json_serializer),
+                serializers.dumps(context, fields=self.json_fields),
                 **response_kwargs)
         elif self.is_text:
             try:
@@ -311,7 +335,94 @@ class HistoryMixin(object):
         return success_url
 
 
-class DetailView(AbstractBaseView, BaseDetailView, HistoryMixin):
+class ConditionalGetMixin(object):
+
+    """ Conditional GET support for views on a single object. The ETag is
+    derived from the object's cache key, changed date and workflow state,
+    the permission class of the user and the content type of the response,
+    so a client gets a 304 only if rendering would give the same result.
+    Validation is by ETag only: a Last-Modified date would only cover the
+    changed date, and not the state or the permissions of the user.
+    Call not_modified before doing any real work, and pass the final
+    response through add_conditional_headers. """
+
+    def get_etag(self, content_type):
+
+        obj = self.object
+
+        if isinstance(obj, BaseContent):
+            key = obj.get_cache_key()
+            state = "%s:%s" % (obj.visibility.state, obj.visibility.published)
+        else:
+            key = "%s_%s" % (obj.__class__.__name__.lower(), obj.pk)
+            state = getattr(get_state(obj), "name", None)
+
+        changed = getattr(obj, "changed", None)
+
+        value = ":".join([
+            key,
+            changed and changed.isoformat() or "",
+            str(state),
+            permission_class(self.request.user, obj),
+            content_type,
+            self.request.is_ajax() and "ajax" or "",
+            getattr(self.request, "LANGUAGE_CODE", "")])
+
+        return hashlib.md5(value.encode("utf-8")).hexdigest()
+
+    def not_modified(self, content_type="text/html"):
+
+        """ Return a 304 response if the client's copy is still valid,
+        or None if the view needs to render """
+
+        self._etag = quote_etag(self.get_etag(content_type))
+
+        response = get_conditional_response(self.request, etag=self._etag)
+
+        if response is not None:
+            response = self.add_conditional_headers(response)
+
+        return response
+
+    def add_conditional_headers(self, response):
+
+        if response.status_code in (200, 304):
+            response["ETag"] = self._etag
+
+        # Always revalidate, and never share between users
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Accept", "Cookie", "X-Requested-With"))
+
+        return response
+
+
+class ServerTimingMixin(object):
+
+    """ Add the profiled totals of the request as Server-Timing header,
+    if both PROFILE_SIGNALS and PROFILE_SERVER_TIMING are set """
+
+    def dispatch(self, request, *args, **kwargs):
+
+        if not SERVER_TIMING:
+            return super(ServerTimingMixin, self).dispatch(
+                request, *args, **kwargs)
+
+        profiling.start_request()
+
+        try:
+            response = super(ServerTimingMixin, self).dispatch(
+                request, *args, **kwargs)
+        finally:
+            timing = profiling.end_request()
+
+        if timing:
+            response["Server-Timing"] = timing
+
+        return response
+
+
+class DetailView(ServerTimingMixin, AbstractBaseView, BaseDetailView,
+                 HistoryMixin, ConditionalGetMixin):
 
     """ Detail view for simple content, not related, etc. All intranet
     detail views should extend this view.
@@ -337,6 +448,23 @@ class DetailView(AbstractBaseView, BaseDetailView, HistoryMixin):
 
         return templates
 
+    def get_snippet_cache_key(self, content_type):
+
+        """ The record snippet rendered for Ajax requests is cached per
+        permission class of the user, if the type is registered with
+        cache_snippet set to True. Return None if this request does not
+        render a cacheable snippet. """
+
+        if (content_type != "text/html" or self.template_name or
+                not self.request.is_ajax() or
+                self.request.GET.get("modal", False) or
+                not CTRegistry.get(self.ct_name).get("cache_snippet", False)):
+            return None
+
+        return fragment_key(
+            self.object, "snippet", self.request.GET.urlencode(),
+            permission_class(self.request.user, self.object))
+
     @property
     def state(self):
 
@@ -361,12 +489,16 @@ class DetailView(AbstractBaseView, BaseDetailView, HistoryMixin):
         if not has_permission(perm, self.request.user, self.object):
             return HttpResponseForbidden(forbidden_page(request))
 
-        context = self.get_context_data(object=self.object)
         content_type = self._determine_content_type()
 
         if content_type == "text/html":
             self.add_to_history()
 
+        response = self.not_modified(content_type)
+
+        if response is not None:
+            return response
+
         if hasattr(self.object, 'images'):
             '''
             20191121
@@ -401,7 +533,23 @@ class DetailView(AbstractBaseView, BaseDetailView, HistoryMixin):
             # else:
             #     print("no need to check")
 
-        return self.render_to_response(context, content_type=content_type)
+        snippet_key = self.get_snippet_cache_key(content_type)
+
+        if snippet_key:
+            content = get_fragment(snippet_key)
+
+            if content is not None:
+                return self.add_conditional_headers(
+                    HttpResponse(content, content_type=content_type))
+
+        context = self.get_context_data(object=self.object)
+        response = self.render_to_response(context, content_type=content_type)
+
+        if snippet_key:
+            response.render()
+            set_fragment(snippet_key, response.content)
+
+        return self.add_conditional_headers(response)
 
 
 class CTDetailView(CTMixin, DetailView):
@@ -412,11 +560,14 @@ class CTDetailView(CTMixin, DetailView):
     @property
     def model(self):
 
+        if getattr(self, "object", None) is not None:
+            return self.object.__class__
+
         return self.get_object().__class__
 
 
-class CreateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
-                 RequestDataMixin, BaseCreateView, HistoryMixin):
+class CreateView(ServerTimingMixin, TemplateResolverMixin, SwappableMixin,
+                 AcceptMixin, RequestDataMixin, BaseCreateView, HistoryMixin):
 
     mode = "add"
     fk_fields = []
@@ -454,6 +605,7 @@ class CreateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
 
         return self.view_url
 
+    @method_decorator(transaction.atomic)
     def get_object(self, queryset=None):
 
         if not getattr(self.real_model, "create_tmp_object", False):
@@ -521,6 +673,7 @@ class CreateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
 
         return self.render_to_response(self.get_context_data(form=form))
 
+    @method_decorator(transaction.atomic)
     def post(self, request, *args, **kwargs):
 
         # Set object. If not set, odd behaviour of the django generic
@@ -590,7 +743,7 @@ class CreateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
                 implements(self.object, BaseContent):
             self.object.set_owner(self.request.user)
 
-        update_index_for_instance(self.object)
+        schedule_index(self.object)
 
         return HttpResponseRedirect(self.get_success_url())
 
@@ -610,8 +763,8 @@ class CreateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
         return HttpResponseRedirect(self.get_redir_url())
 
 
-class UpdateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
-                 RequestDataMixin, BaseUpdateView, HistoryMixin):
+class UpdateView(ServerTimingMixin, TemplateResolverMixin, SwappableMixin,
+                 AcceptMixin, RequestDataMixin, BaseUpdateView, HistoryMixin):
 
     mode = "edit"
 
@@ -663,6 +816,7 @@ class UpdateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
 
         return super(UpdateView, self).get(request, *args, **kwargs)
 
+    @method_decorator(transaction.atomic)
     def post(self, request, *args, **kwargs):
 
         """ Check whether the user wants to cancel the whole
@@ -712,6 +866,8 @@ class UpdateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
         except:
             pass
 
+        # The content signals of both saves are sent only once, when the
+        # transaction of post commits (see djinn_contenttypes.dispatch)
         self.object.save()
 
         if self.request.POST.get('action', 'save') == 'saveandedit':
@@ -723,7 +879,7 @@ class UpdateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
             messages.success(self.request, _("Saved changes"))
 
         # call once after all save's
-        update_index_for_instance(self.object)
+        schedule_index(self.object)
 
         return HttpResponseRedirect(self.get_success_url())
 
@@ -743,8 +899,8 @@ class UpdateView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
         return HttpResponseRedirect(self.get_redir_url())
 
 
-class DeleteView(TemplateResolverMixin, SwappableMixin, AcceptMixin,
-                 BaseDeleteView, HistoryMixin):
+class DeleteView(ServerTimingMixin, TemplateResolverMixin, SwappableMixin,
+                 AcceptMixin, BaseDeleteView, HistoryMixin):
 
     mode = "delete"
 
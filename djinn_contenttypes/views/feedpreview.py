@@ -1,8 +1,9 @@
 from django.views.generic import DetailView
 from djinn_contenttypes.utils import get_object_by_ctype_id
+from djinn_contenttypes.views.base import ConditionalGetMixin
 
 
-class FeedPreview(DetailView):
+class FeedPreview(ConditionalGetMixin, DetailView):
 
     template_name = 'djinn_contenttypes/feed_preview.html'
 
@@ -10,10 +11,23 @@ class FeedPreview(DetailView):
 
         return get_object_by_ctype_id(self.kwargs['ctype'], self.kwargs['id'])
 
+    def get(self, request, *args, **kwargs):
+
+        self.object = self.get_object()
+
+        response = self.not_modified()
+
+        if response is not None:
+            return response
+
+        context = self.get_context_data(object=self.object)
+
+        return self.add_conditional_headers(self.render_to_response(context))
+
     def get_context_data(self, **kwargs):
 
         ctx = super().get_context_data(**kwargs)
 
         ctx['feed_name'] = "%s_feed_preview" % self.kwargs.get('ctype')
 
-        return ctx
\ No newline at end of file
+        return ctx
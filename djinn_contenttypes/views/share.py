@@ -88,7 +88,7 @@ class ShareView(MimeTypeMixin, FormView, CTMixin):
             Events.send(
                 self.notification_type,
                 user=self.request.user,
-                content_item=self.get_object(),
+                content_item=self.obj,
                 message=form.cleaned_data['message'])
 
         elif form.cleaned_data['recipient'] == "group":
@@ -99,7 +99,7 @@ class ShareView(MimeTypeMixin, FormView, CTMixin):
                     self.notification_type,
                     user=self.request.user,
                     to_usergroup=group.usergroup,
-                    content_item=self.get_object(),
+                    content_item=self.obj,
                     message=form.cleaned_data['message'])
 
         elif form.cleaned_data['recipient'] == "user":
@@ -110,7 +110,7 @@ class ShareView(MimeTypeMixin, FormView, CTMixin):
                     self.notification_type,
                     user=self.request.user,
                     to_user=user.user,
-                    content_item=self.get_object(),
+                    content_item=self.obj,
                     message=form.cleaned_data['message'])
 
         return super(ShareView, self).form_valid(form)